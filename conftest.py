@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def temporary_metrics():
+    """Тесты под pytest тоже не пишут в общий файл метрик хоста."""
+    from core.testing import temporary_metrics
+
+    with temporary_metrics():
+        yield
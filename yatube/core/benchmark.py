@@ -0,0 +1,162 @@
+import random
+import time
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from faker import Faker
+from mixer.backend.django import mixer
+
+from core.queries import QueryCounter
+from core.timing import percentile
+from posts import urls as posts_urls
+from posts.models import Comment, Follow, Group, Post, User
+from users import urls as users_urls
+
+# Объем данных по умолчанию: сколько объектов каждой модели создать.
+DEFAULT_SIZE = {'users': 20, 'groups': 5, 'posts': 300, 'comments': 600,
+                'follows': 60}
+USERNAME = 'bench'
+
+
+def seed(size, random_seed=0):
+    """
+    Заполнить пустую базу данными заданного объема. Объекты создаются
+    по одному, поэтому сигналы ведут счетчики и ленты подписок как
+    в жизни. Возвращает пользователя, от имени которого идут запросы.
+    """
+    random.seed(random_seed)
+    Faker.seed(random_seed)
+    user = mixer.blend(User, username=USERNAME)
+    users = [user, *mixer.cycle(size['users'] - 1).blend(
+        User, username=mixer.sequence('user{0}'))]
+    groups = mixer.cycle(size['groups']).blend(
+        Group, slug=mixer.sequence('group{0}'))
+    posts = mixer.cycle(size['posts']).blend(
+        Post, author=mixer.RANDOM(*users), group=mixer.RANDOM(*groups),
+        text=mixer.faker.text, image='')
+    mixer.cycle(size['comments']).blend(
+        Comment, post=mixer.RANDOM(*posts), author=mixer.RANDOM(*users),
+        text=mixer.faker.sentence)
+    pairs = {(follower.pk, author.pk) for follower in users
+             for author in random.sample(users, 3) if follower != author}
+    for follower_id, author_id in sorted(pairs)[:size['follows']]:
+        Follow.objects.get_or_create(user_id=follower_id, author_id=author_id)
+    # Страницы записи и профиля открываются для своей записи
+    # и для автора, на которого пользователь подписан.
+    mixer.blend(Post, author=user, group=groups[0], text=mixer.faker.text,
+                image='')
+    Follow.objects.get_or_create(user=user, author=followed(user))
+    return user
+
+
+def followed(user):
+    return User.objects.exclude(pk=user.pk).order_by('pk').first()
+
+
+def route_kwargs(name, user):
+    """Аргументы адреса маршрута app:name на засеянных данных."""
+    route = name.partition(':')[2]
+    if route == 'group_list':
+        return {'slug': Group.objects.order_by('pk').first().slug}
+    if route.startswith('profile'):
+        return {'username': followed(user).username}
+    if route in ('post_detail', 'post_edit', 'post_comments', 'add_comment'):
+        post = Post.objects.filter(author=user).first()
+        return {'post_id': post.pk}
+    if route == 'password_reset_confirm':
+        return {'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
+                'token': default_token_generator.make_token(user)}
+    return {}
+
+
+def routes():
+    """Все маршруты posts/urls.py и users/urls.py: posts:index и т.д."""
+    return [f'{module.app_name}:{pattern.name}'
+            for module in (posts_urls, users_urls)
+            for pattern in module.urlpatterns]
+
+
+def series(client, url, requests, login, cold):
+    """
+    Время ответов серии в миллисекундах и наибольшее число SQL-запросов.
+    cold - очищать кэш перед каждым запросом: страница всякий раз
+    собирается заново; иначе кэш очищается один раз перед серией.
+    """
+    cache.clear()
+    durations, queries = [], 0
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        if login is not None and '_auth_user_id' not in client.session:
+            client.force_login(login)
+        with QueryCounter() as counter:
+            start = time.monotonic()
+            client.get(url)
+            durations.append((time.monotonic() - start) * 1000)
+        queries = max(queries, counter.count)
+    return durations, queries
+
+
+def measure(client, url, requests, login=None):
+    """
+    Перцентили времени ответов: p50/p95/p99 - как в жизни, когда почти
+    все ответы берутся из кэша страниц; cold_p50/cold_p95 - сборка
+    страницы без кэша, иначе регрессию рендеринга не видно за попаданиями
+    в кэш. queries - наибольшее число SQL-запросов, оно у сборки.
+    """
+    durations, _ = series(client, url, requests, login, cold=False)
+    cold, queries = series(client, url, requests, login, cold=True)
+    return {
+        'p50': round(percentile(durations, 0.5), 2),
+        'p95': round(percentile(durations, 0.95), 2),
+        'p99': round(percentile(durations, 0.99), 2),
+        'cold_p50': round(percentile(cold, 0.5), 2),
+        'cold_p95': round(percentile(cold, 0.95), 2),
+        'queries': queries,
+    }
+
+
+def run(user, requests):
+    """
+    Замеры всех маршрутов анонимно и от имени user. Адрес строится
+    после входа: вход меняет last_login, а с ним и токен сброса пароля.
+    """
+    results = {}
+    for name in routes():
+        url = reverse(name, kwargs=route_kwargs(name, user))
+        results[f'{name} anonymous'] = measure(Client(), url, requests)
+        client = Client()
+        client.force_login(user)
+        url = reverse(name, kwargs=route_kwargs(name, user))
+        results[f'{name} user'] = measure(client, url, requests, login=user)
+    return results
+
+
+def compare(results, baseline, tolerance, slack):
+    """
+    Регрессии относительно базовой линии: больше SQL-запросов или
+    p95 (с кэшем или без) выше базового больше чем в 1 + tolerance раз
+    и на slack мс.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{key}: SQL-запросов {result["queries"]}, '
+                f'было {base["queries"]}')
+        for name, label in (('p95', 'p95'), ('cold_p95', 'p95 без кэша')):
+            if name not in base:
+                continue
+            limit = max(base[name] * (1 + tolerance), base[name] + slack)
+            if result[name] > limit:
+                regressions.append(
+                    f'{key}: {label} {result[name]} мс, '
+                    f'было {base[name]} мс')
+    return regressions
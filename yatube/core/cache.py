@@ -0,0 +1,235 @@
+import pickle
+import threading
+import time
+
+from django.core.cache.backends import locmem
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core.sqlite import shared_connection
+from core.timing import timed
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL,'
+    ' accessed REAL NOT NULL, size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 1), size INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_stats (id, size) VALUES (1, 0)',
+)
+
+
+class TimedCacheMixin:
+    """Обращения к кэшу попадают в фазу cache разбивки Server-Timing."""
+
+    @timed('cache')
+    def add(self, *args, **kwargs):
+        return super().add(*args, **kwargs)
+
+    @timed('cache')
+    def get(self, *args, **kwargs):
+        return super().get(*args, **kwargs)
+
+    @timed('cache')
+    def set(self, *args, **kwargs):
+        return super().set(*args, **kwargs)
+
+    @timed('cache')
+    def get_many(self, *args, **kwargs):
+        return super().get_many(*args, **kwargs)
+
+    @timed('cache')
+    def set_many(self, *args, **kwargs):
+        return super().set_many(*args, **kwargs)
+
+    @timed('cache')
+    def delete(self, *args, **kwargs):
+        return super().delete(*args, **kwargs)
+
+    @timed('cache')
+    def incr(self, *args, **kwargs):
+        return super().incr(*args, **kwargs)
+
+
+class LocMemCache(TimedCacheMixin, locmem.LocMemCache):
+    """Кэш в памяти процесса с замером времени обращений."""
+
+
+class _SQLiteCacheBase(BaseCache):
+    """
+    Кэш в файле SQLite, общий для всех процессов одного хоста.
+
+    LOCATION - путь к файлу. OPTIONS:
+    MAX_SIZE - предельный суммарный размер значений в байтах;
+    при превышении вытесняются давно не читанные ключи (LRU).
+
+    add() и incr() атомарны между процессами (BEGIN IMMEDIATE),
+    поэтому на них можно строить блокировки.
+    """
+
+    # Время чтения обновляется не чаще раза в секунду на ключ.
+    touch_resolution = 1
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        options = params.get('OPTIONS', {})
+        self.max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        return shared_connection(self._local, self.location, SCHEMA)
+
+    def _write(self, func):
+        """Выполнить func(conn) в пишущей транзакции."""
+        conn = self.connection
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    @staticmethod
+    def _alive(expires, now):
+        return expires is None or expires > now
+
+    def _store(self, conn, key, value, timeout, only_new=False):
+        now = time.time()
+        row = conn.execute('SELECT expires, size FROM cache WHERE key = ?',
+                           (key,)).fetchone()
+        if only_new and row is not None and self._alive(row[0], now):
+            return False
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed,'
+            ' size) VALUES (?, ?, ?, ?, ?)',
+            (key, data, self.get_backend_timeout(timeout), now, len(data)),
+        )
+        delta = len(data) - (row[1] if row else 0)
+        conn.execute('UPDATE cache_stats SET size = size + ?', (delta,))
+        self._cull(conn, now)
+        return True
+
+    def _cull(self, conn, now):
+        """Удалить просроченные ключи, затем самые давно читанные."""
+        total = conn.execute('SELECT size FROM cache_stats').fetchone()[0]
+        if total <= self.max_size:
+            return
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        target = self.max_size * 3 // 4
+        rows = conn.execute(
+            'SELECT key, size FROM cache ORDER BY accessed').fetchall()
+        total = sum(size for key, size in rows)
+        victims = []
+        for key, size in rows:
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+        conn.execute('UPDATE cache_stats SET size = ?', (total,))
+
+    def _delete(self, conn, key):
+        row = conn.execute('SELECT size FROM cache WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            return False
+        conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        conn.execute('UPDATE cache_stats SET size = size - ?', (row[0],))
+        return True
+
+    def _touch_read(self, keys, now):
+        stale = now - self.touch_resolution
+        self.connection.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ? AND accessed < ?',
+            [(now, key, stale) for key in keys],
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._write(
+            lambda conn: self._store(conn, key, value, timeout, True))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(lambda conn: self._store(conn, key, value, timeout))
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        made = {self.make_key(key, version=version): key for key in keys}
+        now = time.time()
+        placeholders = ', '.join('?' * len(made))
+        rows = self.connection.execute(
+            f'SELECT key, value, expires FROM cache'
+            f' WHERE key IN ({placeholders})', list(made),
+        ).fetchall()
+        found, touched = {}, []
+        for key, value, expires in rows:
+            if self._alive(expires, now):
+                found[made[key]] = pickle.loads(value)
+                touched.append(key)
+        if touched:
+            self._touch_read(touched, now)
+        return found
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        return self._write(lambda conn: self._delete(conn, key))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        row = self.connection.execute(
+            'SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+        return row is not None and self._alive(row[0], time.time())
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарное увеличение значения в одной транзакции."""
+        key = self.make_key(key, version=version)
+
+        def increment(conn):
+            row = conn.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or not self._alive(row[1], time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            conn.execute('UPDATE cache SET value = ? WHERE key = ?',
+                         (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+            return value
+
+        return self._write(increment)
+
+    def clear(self):
+        def clear_all(conn):
+            conn.execute('DELETE FROM cache')
+            conn.execute('UPDATE cache_stats SET size = 0')
+
+        self._write(clear_all)
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами своего потока.
+        pass
+
+
+class SQLiteCache(TimedCacheMixin, _SQLiteCacheBase):
+    """Общий кэш в файле SQLite с замером времени обращений."""
@@ -0,0 +1,17 @@
+import json
+
+
+def json_records(path):
+    """
+    Записи JSON из файла лога по одной на строку. Префикс форматтера
+    (дата и т.п.) до первой { отбрасывается, строки без JSON пропускаются.
+    """
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            start = line.find('{')
+            if start == -1:
+                continue
+            try:
+                yield json.loads(line[start:])
+            except ValueError:
+                continue
@@ -0,0 +1,109 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from core import benchmark
+from core.testing import temporary_metrics
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер всех адресов posts и users на синтетических '
+            'данных: p50/p95/p99 и SQL-запросы против базовой линии')
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.DEFAULT_SIZE.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать: {name}',
+            )
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Сколько запросов на каждый адрес',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора данных',
+        )
+        parser.add_argument(
+            '--baseline', default=os.path.join(
+                settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+            help='Файл базовой линии',
+        )
+        parser.add_argument(
+            '--write-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый рост p95 в долях от базового',
+        )
+        parser.add_argument(
+            '--slack', type=float, default=5,
+            help='Допустимый рост p95 в миллисекундах',
+        )
+
+    def handle(self, *args, **options):
+        size = {name: options[name] for name in benchmark.DEFAULT_SIZE}
+        results = self.measure(size, options)
+        self.report(results)
+        if options['write_baseline']:
+            self.write_baseline(options['baseline'], size, results)
+            return
+        self.check_baseline(options, size, results)
+
+    def measure(self, size, options):
+        # Замер идет в отдельной тестовой базе и с временным файлом
+        # метрик: рабочие данные и /metrics сайта не трогаем.
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            with temporary_metrics():
+                user = benchmark.seed(size, options['seed'])
+                return benchmark.run(user, options['requests'])
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+    def report(self, results):
+        self.stdout.write(f'{"адрес":<42} {"p50":>8} {"p95":>8} '
+                          f'{"p99":>8} {"cold p50":>9} {"cold p95":>9} '
+                          f'{"SQL":>5}')
+        for key, result in results.items():
+            self.stdout.write(
+                f'{key:<42} {result["p50"]:>8.1f} {result["p95"]:>8.1f} '
+                f'{result["p99"]:>8.1f} {result["cold_p50"]:>9.1f} '
+                f'{result["cold_p95"]:>9.1f} {result["queries"]:>5}')
+
+    def write_baseline(self, path, size, results):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'size': size, 'results': results}, file,
+                      ensure_ascii=False, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(f'Базовая линия записана в {path}')
+
+    def check_baseline(self, options, size, results):
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            raise CommandError(
+                f'Нет базовой линии {options["baseline"]}: '
+                f'запустите с --write-baseline')
+        if baseline['size'] != size:
+            raise CommandError(
+                f'Базовая линия снята на другом объеме данных: '
+                f'{baseline["size"]}')
+        regressions = benchmark.compare(
+            results, baseline['results'], options['tolerance'],
+            options['slack'])
+        if regressions:
+            raise CommandError('Регрессии производительности:\n'
+                               + '\n'.join(regressions))
+        self.stdout.write('Регрессий нет')
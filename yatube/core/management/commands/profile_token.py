@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Печатает значение заголовка X-Profile для профилирования запроса'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
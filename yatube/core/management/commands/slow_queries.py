@@ -0,0 +1,63 @@
+import glob
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.logs import json_records
+
+
+def read_log(path):
+    """Записи лога медленных запросов вместе с ротированными файлами."""
+    records = []
+    for name in [path, *glob.glob(f'{glob.escape(path)}.*')]:
+        records.extend(json_records(name))
+    return records
+
+
+def worst_queries(records, limit):
+    """
+    Запросы, сгруппированные по тексту SQL, в порядке суммарного
+    времени: (sql, записи, самая медленная запись).
+    """
+    groups = defaultdict(list)
+    for record in records:
+        groups[record['sql']].append(record)
+    worst = sorted(groups.items(),
+                   key=lambda item: sum(r['ms'] for r in item[1]),
+                   reverse=True)
+    return [(sql, group, max(group, key=lambda record: record['ms']))
+            for sql, group in worst[:limit]]
+
+
+class Command(BaseCommand):
+    help = 'Самые дорогие SQL-запросы из лога медленных запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=None,
+            help='Файл лога, по умолчанию SLOW_QUERY_LOG',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Сколько запросов показать',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.SLOW_QUERY_LOG
+        try:
+            records = read_log(path)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        for sql, group, slowest in worst_queries(records, options['limit']):
+            total = sum(record['ms'] for record in group)
+            views = ', '.join(sorted({record['view'] for record in group}))
+            self.stdout.write(
+                f'{len(group)} раз, всего {total:.1f} мс, '
+                f'максимум {slowest["ms"]:.1f} мс; {views}')
+            self.stdout.write(f'  {sql}')
+            for line in slowest['plan']:
+                self.stdout.write(f'  план: {line}')
+            for frame in slowest['stack']:
+                self.stdout.write(f'  стек: {frame}')
+        self.stdout.write(f'Всего медленных запросов: {len(records)}')
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.logs import json_records
+from core.timing import PHASES, percentile
+
+
+def read_log(path):
+    """Замеры из лога core.timing, сгруппированные по представлениям."""
+    views = defaultdict(list)
+    for record in json_records(path):
+        views[record['view']].append(record)
+    return views
+
+
+class Command(BaseCommand):
+    help = 'Сводка по логу Server-Timing: время представлений по фазам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=None,
+            help='Файл лога, по умолчанию TIMING_LOG',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'TIMING_LOG', None)
+        if not path:
+            raise CommandError('Не задан файл лога: укажите путь '
+                               'или TIMING_LOG')
+        try:
+            views = read_log(path)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        columns = ('view', 'n', 'p50', 'p95', 'sql', *PHASES)
+        self.stdout.write(' '.join(f'{name:>10}' for name in columns))
+        for view, records in sorted(views.items()):
+            totals = [record['total_ms'] for record in records]
+            means = [sum(record[f'{name}_ms'] for record in records)
+                     / len(records) for name in PHASES]
+            queries = sum(record['queries'] for record in records)
+            row = (f'{view:>10} {len(records):>10} '
+                   f'{percentile(totals, 0.5):>10.1f} '
+                   f'{percentile(totals, 0.95):>10.1f} '
+                   f'{queries / len(records):>10.1f} ')
+            self.stdout.write(row + ' '.join(f'{mean:>10.1f}'
+                                             for mean in means))
@@ -0,0 +1,157 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from posts.storage import is_hashed
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+# Файлы с хэшем содержимого в имени не меняются никогда.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def max_age():
+    """Сколько секунд браузер не перепроверяет обычные медиафайлы."""
+    return getattr(settings, 'MEDIA_MAX_AGE', 24 * 60 * 60)
+
+
+def media_etag(path, stat):
+    """
+    Сильный валидатор: хэш из имени для content-addressed файлов,
+    иначе время изменения и размер.
+    """
+    if is_hashed(path):
+        return '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    (начало, конец) включительно из заголовка Range с одним диапазоном.
+    None - заголовка нет или он не поддерживается: отдаем весь файл.
+    ValueError - диапазон за пределами файла.
+    """
+    match = RANGE.match(header or '')
+    if match is None or size == 0 and header:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """If-Range разрешает частичный ответ, только если файл тот же."""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload(response, full_path, path):
+    """
+    Передать отдачу файла веб-серверу: MEDIA_SENDFILE = 'x-sendfile'
+    (Apache, lighttpd) или 'x-accel-redirect' (nginx, internal-локация
+    MEDIA_ACCEL_PREFIX). Диапазоны сервер обрабатывает сам.
+    nginx декодирует адрес X-Accel-Redirect, поэтому путь в нем
+    закодирован: пробелы и кириллица в именах файлов не ломают заголовок.
+    """
+    mode = getattr(settings, 'MEDIA_SENDFILE', None)
+    if mode == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    elif mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = quote(prefix + path)
+    else:
+        return False
+    return True
+
+
+@require_safe
+def serve(request, path):
+    """
+    Отдача MEDIA_ROOT без django.conf.urls.static, в том числе при
+    DEBUG=False: ETag и Last-Modified с условными запросами, Range,
+    вечное кэширование имен с хэшем содержимого и X-Sendfile.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+    etag = media_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(request, full_path, path, stat.st_size,
+                                 if_range_matches(request, etag,
+                                                  last_modified))
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = (IMMUTABLE if is_hashed(path)
+                                     else f'public, max-age={max_age()}')
+    return response
+
+
+def file_response(request, full_path, path, size, ranges_allowed):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    if offload(response, full_path, path):
+        response['Accept-Ranges'] = 'bytes'
+        return response
+    try:
+        byte_range = (parse_range(request.META.get('HTTP_RANGE'), size)
+                      if ranges_allowed else None)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1),
+            status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,167 @@
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from core.sqlite import shared_connection
+
+logger = logging.getLogger(__name__)
+
+# Метрики: имя -> (тип, описание) для строк # TYPE и # HELP.
+METRICS = {
+    'yatube_requests_total': (
+        'counter', 'Запросы по маршруту, методу и статусу'),
+    'yatube_request_errors_total': (
+        'counter', 'Ответы со статусом 5xx по маршруту'),
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа по маршруту'),
+    'yatube_page_cache_total': (
+        'counter', 'Обращения к кэшу страниц: hit или miss'),
+    'yatube_thumbnails_generated_total': (
+        'counter', 'Созданные миниатюры'),
+    'yatube_thumbnail_lock_waits_total': (
+        'counter', 'Ожидания миниатюры, которую делает другой процесс'),
+}
+HISTOGRAM_SUFFIXES = ('bucket', 'sum', 'count')
+LE = re.compile(r',?le="([^"]+)",?')
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS samples ('
+    ' name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL,'
+    ' PRIMARY KEY (name, labels))',
+)
+UPSERT = (
+    'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+    'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value'
+)
+
+_local = threading.local()
+
+
+def metrics_path():
+    """Файл, в который пишут метрики все процессы хоста."""
+    return getattr(settings, 'METRICS_PATH', os.path.join(
+        tempfile.gettempdir(), 'yatube-metrics.sqlite3'))
+
+
+def connection():
+    """Соединение с файлом метрик, свое у каждого процесса и потока."""
+    return shared_connection(_local, metrics_path(), SCHEMA)
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{escape(value)}"'
+                    for name, value in sorted(labels.items()))
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def record(samples):
+    """
+    Прибавить значения [(имя, {метки}, число)] одной транзакцией.
+    Ошибка файла метрик не должна ломать ответ: она только пишется в лог.
+    """
+    rows = [(name, format_labels(labels), value)
+            for name, labels, value in samples]
+    try:
+        conn = connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(UPSERT, rows)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        logger.exception('Не удалось записать метрики')
+
+
+def inc(name, value=1, **labels):
+    record([(name, labels, value)])
+
+
+def histogram(name, seconds, **labels):
+    """Наблюдение гистограммы: накопительные корзины, сумма и число."""
+    # Корзины, куда наблюдение не попало, тоже пишутся: нулем.
+    samples = [(f'{name}_bucket', {**labels, 'le': str(bound)},
+                int(seconds <= bound)) for bound in BUCKETS]
+    samples += [
+        (f'{name}_bucket', {**labels, 'le': '+Inf'}, 1),
+        (f'{name}_sum', labels, seconds),
+        (f'{name}_count', labels, 1),
+    ]
+    return samples
+
+
+def family(name):
+    """Метрика, к которой относится строка: без _bucket, _sum, _count."""
+    base, _, suffix = name.rpartition('_')
+    if suffix in HISTOGRAM_SUFFIXES and METRICS.get(base, ('',))[0] == (
+            'histogram'):
+        return base
+    return name
+
+
+def sample_order(sample):
+    """Строки гистограммы: по меткам, затем корзины по возрастанию le."""
+    name, labels, _ = sample
+    match = LE.search(labels)
+    bound = float(match.group(1)) if match else 0
+    suffix = name.rpartition('_')[2]
+    return (LE.sub('', labels), HISTOGRAM_SUFFIXES.index(suffix)
+            if suffix in HISTOGRAM_SUFFIXES else 0, bound)
+
+
+def exposition(extra=()):
+    """Все метрики хоста в текстовом формате Prometheus."""
+    rows = connection().execute(
+        'SELECT name, labels, value FROM samples').fetchall()
+    rows += list(extra)
+    families = {}
+    for name, labels, value in rows:
+        families.setdefault(family(name), []).append((name, labels, value))
+    lines = []
+    for base in sorted(families):
+        kind, description = METRICS.get(base, ('untyped', ''))
+        lines += [f'# HELP {base} {description}', f'# TYPE {base} {kind}']
+        for name, labels, value in sorted(families[base], key=sample_order):
+            value = int(value) if float(value).is_integer() else value
+            lines.append(f'{name}{{{labels}}} {value}' if labels
+                         else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def route(request):
+    """Метка маршрута; ненайденные адреса не плодят новых меток."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class MetricsMiddleware:
+    """Число запросов, ошибки и гистограмма времени по маршрутам."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.monotonic()
+        response = self.get_response(request)
+        seconds = time.monotonic() - start
+        view = route(request)
+        samples = [('yatube_requests_total',
+                    {'view': view, 'method': request.method,
+                     'status': str(response.status_code)}, 1)]
+        if response.status_code >= 500:
+            samples.append(('yatube_request_errors_total', {'view': view}, 1))
+        samples += histogram('yatube_request_duration_seconds', seconds,
+                             view=view)
+        record(samples)
+        return response
@@ -0,0 +1,125 @@
+import cProfile
+import os
+import pstats
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+
+from core.queries import view_name
+
+TOKEN_SALT = 'core.profiling'
+# Имя маршрута -> имя каталога: posts:index -> posts.index.
+UNSAFE = re.compile(r'[^\w.-]')
+
+
+def sample_rate():
+    """Какую долю запросов профилировать: 0 - ни одного, 1 - все."""
+    return getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+
+
+def profile_dir():
+    return getattr(settings, 'PROFILE_DIR',
+                   os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def make_token():
+    """Значение заголовка X-Profile, которое включает профилирование."""
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def token_valid(token):
+    max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 24 * 60 * 60)
+    try:
+        signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    """Профилировать случайную долю запросов и запросы с подписью."""
+    token = request.META.get('HTTP_X_PROFILE')
+    if token:
+        return token_valid(token)
+    rate = sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+def view_dir(view):
+    return os.path.join(profile_dir(), UNSAFE.sub('_', view.replace(':', '.')))
+
+
+def save_profile(profiler, view):
+    """
+    Записать pstats запроса в каталог представления. В каталоге
+    остаются только PROFILE_KEEP последних файлов.
+    """
+    directory = view_dir(view)
+    os.makedirs(directory, exist_ok=True)
+    name = f'{time.time():.6f}-{os.getpid()}.prof'
+    profiler.dump_stats(os.path.join(directory, name))
+    keep = getattr(settings, 'PROFILE_KEEP', 50)
+    files = sorted(entry for entry in os.listdir(directory)
+                   if entry.endswith('.prof'))
+    for old in files[:-keep]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+
+
+def profiled_views():
+    """{представление: [файлы pstats]} из PROFILE_DIR."""
+    root = profile_dir()
+    if not os.path.isdir(root):
+        return {}
+    views = {}
+    for view in sorted(os.listdir(root)):
+        directory = os.path.join(root, view)
+        if not os.path.isdir(directory):
+            continue
+        files = [os.path.join(directory, name)
+                 for name in sorted(os.listdir(directory))
+                 if name.endswith('.prof')]
+        if files:
+            views[view] = files
+    return views
+
+
+def top_functions(files, limit=20):
+    """
+    Функции с наибольшим суммарным временем по всем файлам
+    представления: (функция, вызовов, собственное, суммарное), секунды.
+    """
+    stats = pstats.Stats(*files)
+    rows = [(pstats.func_std_string(func), calls, own, cumulative)
+            for func, (_, calls, own, cumulative, _) in stats.stats.items()]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:limit]
+
+
+class ProfilingMiddleware:
+    """
+    cProfile для доли запросов PROFILE_SAMPLE_RATE и для запросов
+    с подписанным заголовком X-Profile (core.profiling.make_token).
+    Результат пишется в PROFILE_DIR/<маршрут>/*.prof.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        if getattr(request, 'resolver_match', None) is not None:
+            save_profile(profiler, view_name(request))
+        return response
@@ -0,0 +1,82 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """
+    Обертка execute_wrapper: число SQL-запросов и время на них.
+    С record=True запоминает и текст запросов.
+    """
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if record else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.monotonic() - start
+            self.count += 1
+            if self.statements is not None:
+                self.statements.append(sql)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+
+def view_name(request):
+    """Имя маршрута вида posts:index; для ненайденных адресов - путь."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name
+
+
+def budget_for(view):
+    """
+    Сколько запросов может сделать представление: QUERY_BUDGETS
+    по имени маршрута, иначе QUERY_BUDGET. None - не проверять.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view, getattr(settings, 'QUERY_BUDGET', None))
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы и их время на каждый запрос к сайту и пишет
+    предупреждение, если представление вышло за свой бюджет.
+    Счетчик остается в request.queries для следующих middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryCounter() as counter:
+            request.queries = counter
+            response = self.get_response(request)
+        view = view_name(request)
+        budget = budget_for(view)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                '%s: %d SQL-запросов при бюджете %d (%.1f мс)',
+                view, counter.count, budget, counter.duration * 1000)
+        else:
+            logger.debug('%s: %d SQL-запросов, %.1f мс',
+                         view, counter.count, counter.duration * 1000)
+        return response
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from core.queries import view_name
+
+logger = logging.getLogger(__name__)
+
+# План запрашивается только для чтения и изменения строк.
+EXPLAINED = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+STACK_DEPTH = 8
+# Параметры пишутся как есть только для запросов к таблицам постов:
+# в остальных бывают ключи сессий, хеши паролей и адреса почты.
+OPEN_TABLES = ('posts_',)
+REDACTED = '***'
+TABLES = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+"?(\w+)"?', re.I)
+# Обертки и middleware замеров: в стеке медленного запроса они не нужны.
+INSTRUMENTATION = ('core/queries.py', 'core/timing.py', 'core/metrics.py',
+                   'core/profiling.py', 'core/slow_queries.py')
+
+
+def threshold():
+    """Запросы дольше стольких миллисекунд попадают в лог; None - выкл."""
+    return getattr(settings, 'SLOW_QUERY_MS', 100)
+
+
+def logged_params(sql, params):
+    """
+    Параметры запроса для лога. Если запрос затрагивает хоть одну
+    таблицу не из OPEN_TABLES, значения заменяются на REDACTED.
+    """
+    params = params or ()
+    tables = TABLES.findall(sql)
+    if tables and all(table.startswith(OPEN_TABLES) for table in tables):
+        return [str(value) for value in params]
+    return [REDACTED] * len(params)
+
+
+def query_plan(connection, sql, params):
+    """
+    EXPLAIN QUERY PLAN запроса: строки плана SQLite через отдельный
+    курсор без оберток Django, чтобы не сбить результат исходного
+    запроса и не попасть в лог повторно.
+    """
+    if (not connection.features.supports_explaining_query_execution
+            or not sql.lstrip().upper().startswith(EXPLAINED)):
+        return []
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}',
+                       params)
+        # В строке SQLite id, parent, notused и описание шага.
+        return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f'Не удалось получить план: {error}']
+    finally:
+        cursor.close()
+
+
+def project_stack():
+    """Последние кадры стека из кода проекта, без Django и замеров."""
+    root = settings.BASE_DIR + os.sep
+    frames = [(os.path.relpath(frame.filename, root), frame)
+              for frame in traceback.extract_stack()
+              if frame.filename.startswith(root)]
+    return [f'{name}:{frame.lineno} {frame.name}'
+            for name, frame in frames
+            if name not in INSTRUMENTATION][-STACK_DEPTH:]
+
+
+class SlowQueryLogger:
+    """Обертка execute_wrapper: медленные запросы с планом и стеком в лог."""
+
+    def __init__(self, request, limit):
+        self.request = request
+        self.limit = limit
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        result = execute(sql, params, many, context)
+        duration = (time.monotonic() - start) * 1000
+        if duration >= self.limit:
+            self.log(context['connection'], sql, params, many, duration)
+        return result
+
+    def log(self, connection, sql, params, many, duration):
+        logger.warning(json.dumps({
+            'view': view_name(self.request),
+            'ms': round(duration, 2),
+            'sql': sql,
+            'params': None if many else logged_params(sql, params),
+            'plan': [] if many else query_plan(connection, sql, params),
+            'stack': project_stack(),
+        }, ensure_ascii=False))
+
+
+class SlowQueryMiddleware:
+    """
+    Пишет в лог core.slow_queries SQL-запросы дольше SLOW_QUERY_MS
+    вместе с маршрутом, стеком вызова и планом выполнения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limit = threshold()
+        if limit is None:
+            return self.get_response(request)
+        wrapper = SlowQueryLogger(request, limit)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
@@ -0,0 +1,24 @@
+import os
+import sqlite3
+
+
+def shared_connection(local, path, schema):
+    """
+    Соединение с файлом SQLite, который делят процессы хоста: WAL,
+    ожидание блокировки до 30 секунд, транзакции вручную (BEGIN
+    IMMEDIATE). Соединение нельзя переносить между процессами (fork)
+    и потоками, поэтому оно хранится в threading.local владельца
+    и открывается заново в новом процессе или для другого файла.
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None or local.key != (os.getpid(), path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in schema:
+            conn.execute(statement)
+        local.conn, local.key = conn, (os.getpid(), path)
+    return conn
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from core.queries import QueryCounter
+
+
+@contextmanager
+def temporary_metrics():
+    """
+    Метрики пишутся во временный файл, а не в общий METRICS_PATH хоста,
+    который читает /metrics рабочего сайта. Подключается и в TestRunner
+    (manage.py test), и фикстурой в conftest.py (pytest).
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        with override_settings(
+                METRICS_PATH=os.path.join(directory, 'metrics.sqlite3')):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """manage.py test с метриками во временном файле."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics = temporary_metrics()
+        self.metrics.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.metrics.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """Проверка бюджета SQL-запросов в тестах представлений."""
+
+    def assertQueryBudget(self, budget, url, method='get', client=None,
+                          **kwargs):
+        """
+        Выполнить запрос тестовым клиентом и упасть, если SQL-запросов
+        больше budget. Возвращает ответ.
+        """
+        client = client or self.client
+        with QueryCounter(record=True) as counter:
+            response = getattr(client, method)(url, **kwargs)
+        if counter.count > budget:
+            self.fail('\n'.join([
+                f'{method.upper()} {url}: {counter.count} SQL-запросов, '
+                f'бюджет {budget}', *counter.statements]))
+        return response
@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from core import benchmark
+
+
+class BenchmarkTest(TestCase):
+    """Тестирование нагрузочного замера."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_measured(self):
+        """Каждый маршрут posts и users замеряется анонимно и с входом"""
+
+        size = {'users': 3, 'groups': 1, 'posts': 5, 'comments': 5,
+                'follows': 2}
+        user = benchmark.seed(size)
+
+        results = benchmark.run(user, requests=1)
+
+        expected = {f'{name} {mode}' for name in benchmark.routes()
+                    for mode in ('anonymous', 'user')}
+        self.assertEqual(set(results), expected)
+        self.assertIn('posts:index user', results)
+        self.assertIn('users:password_reset_confirm anonymous', results)
+        for result in results.values():
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertLessEqual(result['cold_p50'], result['cold_p95'])
+
+    def test_compare(self):
+        """Регрессия - рост числа запросов или p95 сверх допуска"""
+
+        baseline = {
+            'posts:index anonymous': {'p95': 10, 'cold_p95': 30,
+                                      'queries': 2},
+            'posts:profile user': {'p95': 10, 'cold_p95': 30, 'queries': 6},
+            'posts:post_detail user': {'p95': 3, 'cold_p95': 20,
+                                       'queries': 4},
+        }
+        results = {
+            'posts:index anonymous': {'p95': 14, 'cold_p95': 34,
+                                      'queries': 3},
+            'posts:profile user': {'p95': 40, 'cold_p95': 30, 'queries': 6},
+            'posts:post_detail user': {'p95': 3, 'cold_p95': 200,
+                                       'queries': 4},
+            'posts:new user': {'p95': 1000, 'cold_p95': 1000,
+                               'queries': 100},
+        }
+
+        regressions = benchmark.compare(results, baseline, tolerance=0.5,
+                                        slack=5)
+
+        self.assertEqual(regressions, [
+            'posts:index anonymous: SQL-запросов 3, было 2',
+            'posts:profile user: p95 40 мс, было 10 мс',
+            'posts:post_detail user: p95 без кэша 200 мс, было 20 мс',
+        ])
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+WORKERS = 4
+ROUNDS = 50
+
+
+def make_cache(location, max_size=1024 * 1024):
+    return SQLiteCache(location, {'OPTIONS': {'MAX_SIZE': max_size}})
+
+
+def worker(location, queue):
+    """Процесс-воркер: наращивает счетчик и пытается взять блокировку."""
+    cache = make_cache(location)
+    locks = 0
+    for i in range(ROUNDS):
+        cache.incr('counter')
+        if cache.add(f'lock-{i}', os.getpid()):
+            locks += 1
+        cache.set(f'{os.getpid()}-{i}', i)
+    queue.put(locks)
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    """Тестирование общего для процессов кэша."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """set/get/add/delete/incr и срок жизни ключей"""
+
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertTrue(self.cache.delete('key'))
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('expired', 1, timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction(self):
+        """При превышении MAX_SIZE вытесняются давно не читанные ключи"""
+
+        cache = make_cache(self.location, max_size=20000)
+        cache.touch_resolution = 0
+        cache.set('hot', b'x' * 4000)
+        for i in range(10):
+            cache.get('hot')
+            cache.set(f'cold-{i}', b'x' * 4000)
+
+        self.assertIsNotNone(cache.get('hot'))
+        self.assertIsNone(cache.get('cold-0'))
+        size = cache.connection.execute(
+            'SELECT SUM(size) FROM cache').fetchone()[0]
+        self.assertLessEqual(size, 20000)
+
+    def test_shared_between_processes(self):
+        """
+        Процессы видят общие данные, incr не теряет обновлений,
+        а add отдает каждую блокировку ровно одному процессу
+        """
+
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=worker,
+                                     args=(self.location, queue))
+                     for _ in range(WORKERS)]
+        for process in processes:
+            process.start()
+        locks = sum(queue.get(timeout=60) for _ in processes)
+        for process in processes:
+            process.join(timeout=60)
+
+        self.assertEqual(self.cache.get('counter'), WORKERS * ROUNDS)
+        self.assertEqual(locks, ROUNDS)
+        for process in processes:
+            self.assertEqual(self.cache.get(f'{process.pid}-7'), 7)
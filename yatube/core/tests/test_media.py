@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from django.test import SimpleTestCase, override_settings
+
+CONTENT = b'0123456789'
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+HASHED = f'posts/{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}.gif'
+UNSAFE = 'posts/Снимок экрана.png'
+
+
+class MediaServeTest(SimpleTestCase):
+    """Тестирование отдачи медиафайлов."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        for name in (HASHED, 'cache/thumb.jpg', UNSAFE):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+        settings = override_settings(MEDIA_ROOT=self.media_root, DEBUG=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_hashed_name_is_immutable(self):
+        """Файл с хэшем в имени кэшируется навсегда, ETag - хэш"""
+
+        response = self.client.get(f'/media/{HASHED}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['ETag'], f'"{DIGEST}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    @override_settings(MEDIA_MAX_AGE=60)
+    def test_conditional_get(self):
+        """Обычный файл перепроверяется по ETag и Last-Modified"""
+
+        response = self.client.get('/media/cache/thumb.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+        not_modified = self.client.get(
+            '/media/cache/thumb.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(
+            '/media/cache/thumb.jpg',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_ranges(self):
+        """Диапазоны байтов, If-Range и недопустимый диапазон"""
+
+        cases = {
+            'bytes=2-5': (206, b'2345', 'bytes 2-5/10'),
+            'bytes=7-': (206, b'789', 'bytes 7-9/10'),
+            'bytes=-3': (206, b'789', 'bytes 7-9/10'),
+            'bytes=8-100': (206, b'89', 'bytes 8-9/10'),
+        }
+        for header, (status, body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(f'/media/{HASHED}',
+                                           HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+
+        response = self.client.get(f'/media/{HASHED}', HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+        response = self.client.get(f'/media/{HASHED}', HTTP_RANGE='bytes=2-5',
+                                   HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_outside_files(self):
+        """Несуществующие файлы и пути за пределами MEDIA_ROOT - 404"""
+
+        for path in ('/media/posts/missing.gif', '/media/../manage.py',
+                     '/media/posts/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect',
+                       MEDIA_ACCEL_PREFIX='/protected/')
+    def test_accel_redirect(self):
+        """Отдача передается nginx, заголовки кэширования остаются"""
+
+        response = self.client.get(f'/media/{HASHED}')
+
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{HASHED}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect',
+                       MEDIA_ACCEL_PREFIX='/protected/')
+    def test_accel_redirect_quoted(self):
+        """Пробелы и кириллица в пути X-Accel-Redirect закодированы"""
+
+        response = self.client.get(f'/media/{quote(UNSAFE)}')
+
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected/posts/%D0%A1%D0%BD%D0%B8%D0%BC%D0%BE%D0%BA'
+            '%20%D1%8D%D0%BA%D1%80%D0%B0%D0%BD%D0%B0.png')
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import resolve
+
+from core.metrics import BUCKETS, MetricsMiddleware, metrics_path
+
+
+class MetricsTest(TestCase):
+    """Тестирование /metrics."""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        settings = override_settings(
+            METRICS_PATH=os.path.join(directory, 'metrics.sqlite3'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    def test_requests_and_page_cache(self):
+        """Запросы, гистограмма и кэш главной считаются по маршруту"""
+
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/no/such/page/')
+
+        lines = self.scrape()
+        expected = [
+            '# TYPE yatube_requests_total counter',
+            'yatube_requests_total{method="GET",status="200",'
+            'view="posts:index"} 2',
+            'yatube_requests_total{method="GET",status="404",'
+            'view="<unresolved>"} 1',
+            '# TYPE yatube_request_duration_seconds histogram',
+            'yatube_request_duration_seconds_bucket{le="+Inf",'
+            'view="posts:index"} 2',
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            'yatube_page_cache_total{cache="index_page",result="hit"} 1',
+            'yatube_page_cache_total{cache="index_page",result="miss"} 1',
+            'yatube_thumbnail_lock_waits_total 0',
+        ]
+        for line in expected:
+            with self.subTest(line=line):
+                self.assertIn(line, lines)
+
+        histogram = [line for line in lines if line.startswith(
+            'yatube_request_duration_seconds') and 'posts:index' in line]
+        self.assertEqual(len(histogram), len(BUCKETS) + 3)
+        self.assertTrue(histogram[-1].startswith(
+            'yatube_request_duration_seconds_count'))
+
+    def test_errors(self):
+        """Ответы 5xx считаются отдельно"""
+
+        request = RequestFactory().get('/')
+        request.resolver_match = resolve('/')
+        MetricsMiddleware(lambda request: HttpResponse(status=500))(request)
+
+        self.assertIn('yatube_request_errors_total{view="posts:index"} 1',
+                      self.scrape())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        """С METRICS_TOKEN метрики отдаются только с токеном"""
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics',
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+class TestRunnerTest(SimpleTestCase):
+    """Тестирование изоляции метрик при прогоне тестов."""
+
+    def test_metrics_in_temporary_file(self):
+        """Тесты не пишут в общий файл метрик хоста"""
+
+        self.assertNotEqual(
+            metrics_path(),
+            os.path.join(tempfile.gettempdir(), 'yatube-metrics.sqlite3'))
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.profiling import make_token
+
+User = get_user_model()
+
+
+class ProfilingTest(TestCase):
+    """Тестирование выборочного профилирования запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.staff = User.objects.create_user(username='Admin', is_staff=True)
+        cls.user = User.objects.create_user(username='Leo')
+
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        settings = override_settings(PROFILE_DIR=self.profile_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.profile_dir, True)
+
+    def profiles(self, view):
+        directory = os.path.join(self.profile_dir, view)
+        if not os.path.isdir(directory):
+            return []
+        return os.listdir(directory)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_KEEP=2)
+    def test_sampled_requests(self):
+        """Профили пишутся по каталогу на маршрут, старые удаляются"""
+
+        for _ in range(3):
+            self.client.get('/')
+
+        self.assertEqual(len(self.profiles('posts.index')), 2)
+
+    def test_signed_header(self):
+        """Профилируется только запрос с верной подписью"""
+
+        self.client.get('/', HTTP_X_PROFILE='подделка')
+        self.assertEqual(self.profiles('posts.index'), [])
+
+        self.client.get('/', HTTP_X_PROFILE=make_token())
+        self.assertEqual(len(self.profiles('posts.index')), 1)
+
+    def test_admin_page(self):
+        """Сводка по профилям доступна только персоналу"""
+
+        self.client.get('/profile/Leo/', HTTP_X_PROFILE=make_token())
+
+        self.client.force_login(self.user)
+        response = self.client.get('/admin/profiles/')
+        self.assertRedirects(response,
+                             '/admin/login/?next=/admin/profiles/')
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/admin/profiles/')
+        self.assertContains(response, 'posts.profile (1 проф.)')
+        self.assertContains(response, 'views.py')
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.testing import QueryBudgetMixin
+
+User = get_user_model()
+
+
+class QueryBudgetMiddlewareTest(QueryBudgetMixin, TestCase):
+    """Тестирование бюджета SQL-запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Leo')
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(QUERY_BUDGETS={'posts:profile': 1})
+    def test_warning_over_budget(self):
+        """Представление сверх бюджета попадает в лог с числом запросов"""
+
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get('/profile/Leo/')
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('posts:profile', logs.output[0])
+        self.assertIn('при бюджете 1', logs.output[0])
+
+    @override_settings(QUERY_BUDGET=None, QUERY_BUDGETS={})
+    def test_no_warning_without_budget(self):
+        """Без бюджета запросы только считаются"""
+
+        with self.assertLogs('core.queries', 'DEBUG') as logs:
+            response = self.client.get('/profile/Leo/')
+
+        self.assertGreater(response.wsgi_request.queries.count, 0)
+        self.assertTrue(all(line.startswith('DEBUG:')
+                            for line in logs.output))
+
+    def test_helper_fails_over_budget(self):
+        """assertQueryBudget падает и перечисляет запросы"""
+
+        with self.assertRaises(AssertionError) as error:
+            self.assertQueryBudget(0, '/profile/Leo/')
+
+        self.assertIn('бюджет 0', str(error.exception))
+        self.assertIn('SELECT', str(error.exception))
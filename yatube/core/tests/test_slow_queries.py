@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SlowQueryTest(TestCase):
+    """Тестирование лога медленных запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Leo')
+        Post.objects.create(text='Тестовый текст!', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_query_logged_with_plan(self):
+        """Медленный запрос пишется с маршрутом, планом и стеком"""
+
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            response = self.client.get('/profile/Leo/')
+
+        self.assertContains(response, 'Тестовый текст!')
+        records = [json.loads(record.getMessage())
+                   for record in logs.records]
+        posts = [record for record in records
+                 if record['sql'].startswith('SELECT "posts_post"')]
+        self.assertTrue(posts)
+        self.assertEqual(posts[0]['view'], 'posts:profile')
+        self.assertTrue(any('posts_post' in line or 'SCAN' in line
+                            or 'SEARCH' in line for line in posts[0]['plan']))
+        self.assertTrue(any(frame.startswith('posts/')
+                            for frame in posts[0]['stack']))
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_private_params_redacted(self):
+        """Параметры запросов не к таблицам постов в лог не попадают"""
+
+        self.client.force_login(self.user)
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get('/profile/Leo/')
+
+        records = [json.loads(record.getMessage())
+                   for record in logs.records]
+        private = [record for record in records
+                   if 'django_session' in record['sql']
+                   or 'auth_user' in record['sql']]
+        self.assertTrue(private)
+        for record in private:
+            self.assertEqual(set(record['params']), {'***'})
+        follow = [record for record in records
+                  if record['sql'].startswith('SELECT (1) AS "a" FROM '
+                                              '"posts_follow"')]
+        self.assertTrue(follow)
+        self.assertIn(str(self.user.pk), follow[0]['params'])
+
+    @override_settings(SLOW_QUERY_MS=None)
+    def test_disabled(self):
+        """SLOW_QUERY_MS = None выключает лог"""
+
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.slow_queries', 'WARNING'):
+                self.client.get('/profile/Leo/')
+
+    def test_summary_command(self):
+        """slow_queries сводит запросы из всех файлов лога"""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'slow.log')
+
+        def record(sql, ms, view):
+            return json.dumps({'view': view, 'ms': ms, 'sql': sql,
+                               'params': [], 'plan': ['SCAN posts_follow'],
+                               'stack': ['posts/views.py:1 follow_index']})
+
+        with open(path, 'w', encoding='utf-8') as log:
+            log.write(f'2026-10-18 00:00:00 {record("SELECT 1", 150, "a")}\n')
+            log.write(f'2026-10-18 00:00:01 {record("SELECT 2", 500, "b")}\n')
+        with open(f'{path}.1', 'w', encoding='utf-8') as log:
+            log.write(f'2026-10-18 00:00:02 {record("SELECT 1", 400, "c")}\n')
+
+        out = StringIO()
+        call_command('slow_queries', path, limit=1, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0],
+                         '2 раз, всего 550.0 мс, максимум 400.0 мс; a, c')
+        self.assertEqual(lines[1], '  SELECT 1')
+        self.assertIn('  план: SCAN posts_follow', lines)
+        self.assertEqual(lines[-1], 'Всего медленных запросов: 3')
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.timing import PHASES
+
+User = get_user_model()
+
+
+class ServerTimingTest(TestCase):
+    """Тестирование разбивки времени ответа по фазам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Leo')
+        cls.staff = User.objects.create_user(username='Admin', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_header(self):
+        """Заголовок Server-Timing содержит фазы страницы"""
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/profile/Leo/')
+
+        metrics = {metric.split(';')[0]: metric
+                   for metric in response['Server-Timing'].split(', ')}
+        for name in ('db', 'cache', 'template', 'context', 'total'):
+            with self.subTest(name=name):
+                self.assertIn(name, metrics)
+        self.assertRegex(metrics['db'], r'^db;dur=[\d.]+;desc="\d+ SQL"$')
+
+    def test_shared_cache_timed(self):
+        """Обращения к общему кэшу SQLite тоже попадают в фазу cache"""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        shared = {'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+        }}
+        self.client.force_login(self.staff)
+        with override_settings(CACHES=shared):
+            response = self.client.get('/profile/Leo/')
+
+        self.assertIn('cache;dur=', response['Server-Timing'])
+
+    def test_header_hidden(self):
+        """Посетители и пользователи без прав персонала заголовка не видят"""
+
+        self.assertNotIn('Server-Timing', self.client.get('/profile/Leo/'))
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/profile/Leo/'))
+
+        with override_settings(SERVER_TIMING_PUBLIC=True):
+            self.client.logout()
+            self.assertIn('Server-Timing', self.client.get('/profile/Leo/'))
+
+    def test_log_line(self):
+        """Замеры запроса пишутся в лог одной строкой JSON"""
+
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            self.client.get('/profile/Leo/')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:profile')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        for name in PHASES:
+            self.assertIn(f'{name}_ms', record)
+        self.assertGreaterEqual(record['total_ms'], record['template_ms'])
+
+    def test_timing_report(self):
+        """timing_report сводит лог по представлениям"""
+
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            for _ in range(3):
+                self.client.get('/profile/Leo/')
+            self.client.get('/')
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as log:
+            for record in logs.records:
+                log.write(f'2026-10-18 00:00:00 {record.getMessage()}\n')
+            log.write('битая строка\n')
+
+        out = StringIO()
+        call_command('timing_report', path, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2].split()[:2], ['posts:profile', '3'])
@@ -0,0 +1,152 @@
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.template.backends import django as django_backend
+
+from core.queries import view_name
+
+logger = logging.getLogger(__name__)
+
+# Порядок фаз в заголовке Server-Timing и в логе.
+PHASES = ('db', 'cache', 'thumbnail', 'template', 'context')
+
+_local = threading.local()
+
+
+class Timings:
+    """Сколько секунд запрос провел в каждой фазе."""
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+
+
+def current():
+    """Замеры текущего запроса; вне запроса - None."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def phase(name):
+    """
+    Добавить время блока к фазе name текущего запроса. Вложенный блок
+    той же фазы не считается второй раз: SQLiteCache.get сам вызывает
+    get_many. Разные фазы вкладываются: шаблон включает контекст-процессоры.
+    """
+    timings = current()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings.phases[name] += time.monotonic() - start
+        timings.active.discard(name)
+
+
+def timed(name):
+    """Декоратор: все время функции относится к фазе name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        with phase('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    Бэкенд шаблонов Django, который замеряет рендеринг страниц (фаза
+    template) и контекст-процессоры (фаза context).
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.engine.template_context_processors = tuple(
+            timed('context')(processor)
+            for processor in self.engine.template_context_processors)
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def percentile(values, share):
+    """Значение, не больше которого share всех значений."""
+    values = sorted(values)
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def server_timing(timings, queries, total):
+    """Значение заголовка Server-Timing, время в миллисекундах."""
+    metrics = [f'db;dur={queries.duration * 1000:.1f};'
+               f'desc="{queries.count} SQL"']
+    metrics += [f'{name};dur={timings.phases[name] * 1000:.1f}'
+                for name in PHASES[1:] if timings.phases[name]]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def header_allowed(request):
+    """
+    Заголовок Server-Timing раскрывает устройство сайта: он уходит
+    только при DEBUG, персоналу или всем при SERVER_TIMING_PUBLIC.
+    """
+    if settings.DEBUG or getattr(settings, 'SERVER_TIMING_PUBLIC', False):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class ServerTimingMiddleware:
+    """
+    Разбивка времени ответа по фазам: заголовок Server-Timing и строка
+    JSON в логе core.timing на каждый запрос. Фазы могут вкладываться,
+    поэтому их сумма не обязана совпадать с total. SQL-запросы берутся
+    из request.queries: middleware ставится после QueryBudgetMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = _local.timings = Timings()
+        start = time.monotonic()
+        try:
+            response = self.get_response(request)
+        finally:
+            del _local.timings
+        total = time.monotonic() - start
+        queries = request.queries
+        timings.phases['db'] = queries.duration
+        if header_allowed(request):
+            response['Server-Timing'] = server_timing(timings, queries,
+                                                      total)
+        logger.info(json.dumps({
+            'view': view_name(request),
+            'method': request.method,
+            'status': response.status_code,
+            'queries': queries.count,
+            'total_ms': round(total * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2)
+               for name, seconds in timings.phases.items()},
+        }))
+        return response
@@ -1,6 +1,14 @@
 # core/views.py
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
+from core.metrics import exposition
+from core.profiling import profiled_views, top_functions
+from posts.thumbnails import lock_waits
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -12,3 +20,29 @@ def csrf_failure(request, reason=''):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def profiles(request):
+    """Самые дорогие функции по профилям каждого представления."""
+    views = [(view, len(files), top_functions(files))
+             for view, files in profiled_views().items()]
+    return render(request, 'core/profiles.html', {
+        'views': views,
+        'title': 'Профили запросов',
+        'site_header': admin.site.site_header,
+    })
+
+
+def metrics(request):
+    """
+    Метрики всех процессов хоста для Prometheus. Если задан
+    METRICS_TOKEN, нужен заголовок Authorization: Bearer <токен>.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    # Ожидания считаются в общем кэше, а не в файле метрик.
+    waits = [('yatube_thumbnail_lock_waits_total', '', lock_waits())]
+    return HttpResponse(exposition(waits),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,195 @@
+import threading
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+_local = threading.local()
+
+
+def version_key(name):
+    return f'{name}.version'
+
+
+def default_timeout():
+    """
+    Срок жизни страниц и версий тегов в секундах; None - пока не сменятся
+    версии. Кэш в памяти процесса не видит смены версий в других
+    worker-процессах, поэтому срок у него конечный.
+    """
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 20)
+
+
+def get_version(name):
+    """
+    Текущая версия тега. Если ключ версии вытеснен из кэша или истек,
+    новая версия берется от текущего времени и не совпадает ни с одной
+    прежней.
+    """
+    version = cache.get(version_key(name))
+    if version is None:
+        cache.add(version_key(name), int(time.time() * 1000),
+                  default_timeout())
+        version = cache.get(version_key(name))
+    return version
+
+
+def bump(name):
+    """Сменить версию тега: все страницы со старой версией устаревают."""
+    try:
+        cache.incr(version_key(name))
+    except ValueError:
+        get_version(name)
+
+
+def tag(kind, pk):
+    """Тег объекта, показанного на странице: author:1, group:2, post:3."""
+    return f'{kind}:{pk}'
+
+
+def post_tags(posts):
+    """Теги записей, их авторов и групп."""
+    tags = set()
+    for post in posts:
+        tags.update((tag('post', post.pk), tag('author', post.author_id)))
+        if post.group_id:
+            tags.add(tag('group', post.group_id))
+    return tags
+
+
+def bump_tags(*tags):
+    for name in tags:
+        bump(name)
+
+
+def current_versions(tags):
+    """Текущие версии тегов; у вытесненных из кэша версия None."""
+    versions = cache.get_many([version_key(name) for name in tags])
+    return {name: versions.get(version_key(name)) for name in tags}
+
+
+def set_card_versions(posts):
+    """
+    Версия карточки записи для фрагментного кэша: версии тегов записи,
+    ее автора и группы. Все версии страницы читаются одним get_many.
+    """
+    cards = [(post, sorted(post_tags([post]))) for post in posts]
+    versions = current_versions({name for _, tags in cards for name in tags})
+    for name, version in versions.items():
+        if version is None:
+            versions[name] = get_version(name)
+    for post, tags in cards:
+        post.card_version = '.'.join(str(versions[name]) for name in tags)
+
+
+def skip_page_cache():
+    """
+    Не класть в кэш страницу, которая сейчас собирается: в ней временная
+    замена, например оригинал картинки вместо миниатюры.
+    """
+    _local.skip = True
+
+
+def stale_grace():
+    """Сколько секунд можно отдавать устаревшую страницу."""
+    return getattr(settings, 'CACHE_STALE_GRACE', 10)
+
+
+def is_fresh(entry):
+    """Запись кэша не просрочена и ни один ее тег не сменил версию."""
+    if entry['expires'] is not None and entry['expires'] < time.time():
+        return False
+    return current_versions(entry['versions']) == entry['versions']
+
+
+def single_flight(cache_key, build):
+    """
+    Достать свежую страницу из кэша или пересобрать ее. Пересобирает
+    только тот запрос, который взял блокировку; остальные в это время
+    получают устаревшую копию. Блокировка живет CACHE_STALE_GRACE секунд,
+    так что дольше этого устаревшая копия не отдается. Если копии нет,
+    ждем сборщика не дольше CACHE_BUILD_WAIT секунд.
+    """
+    entry = cache.get(cache_key)
+    if entry is not None and is_fresh(entry):
+        return entry['response']
+    lock_key = f'{cache_key}.lock'
+    if cache.add(lock_key, True, stale_grace()):
+        try:
+            return build()
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        return entry['response']
+    deadline = time.monotonic() + getattr(settings, 'CACHE_BUILD_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(cache_key)
+        if entry is not None and is_fresh(entry):
+            return entry['response']
+    return build()
+
+
+def cache_page(timeout=None, key_prefix='page', tags=(),
+               anonymous_only=False):
+    """
+    Кэш целых страниц с защитой от одновременной пересборки.
+
+    timeout - срок жизни страницы, по умолчанию PAGE_CACHE_TIMEOUT;
+    tags - теги, общие для всех страниц view; view может добавить теги
+    конкретного ответа в response.cache_tags;
+    anonymous_only - кэшировать только страницы для анонимных посетителей.
+    Страницы вошедших пользователей кэшируются для каждого отдельно:
+    в шапке имя пользователя.
+
+    Заголовки кэширования для браузера не выставляются: после смены
+    версии тега страница должна обновиться сразу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or anonymous_only and request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            path = md5(request.get_full_path().encode()).hexdigest()
+            cache_key = f'{key_prefix}.{path}'
+            if request.user.is_authenticated:
+                cache_key = f'{key_prefix}.user{request.user.pk}.{path}'
+
+            built = []
+
+            def build():
+                built.append(True)
+                for name in tags:
+                    get_version(name)
+                versions = current_versions(tags)
+                page_timeout = (default_timeout() if timeout is None
+                                else timeout)
+                expires = (None if page_timeout is None
+                           else time.time() + page_timeout)
+                _local.skip = False
+                response = view(request, *args, **kwargs)
+                if (response.status_code != 200 or response.streaming
+                        or _local.skip):
+                    return response
+                response_tags = getattr(response, 'cache_tags', set())
+                for name in response_tags:
+                    get_version(name)
+                versions.update(current_versions(response_tags))
+                entry = {'response': response, 'versions': versions,
+                         'expires': expires}
+                hard_timeout = (None if page_timeout is None
+                                else page_timeout + stale_grace())
+                cache.set(cache_key, entry, hard_timeout)
+                return response
+
+            response = single_flight(cache_key, build)
+            metrics.inc('yatube_page_cache_total', cache=key_prefix,
+                        result='miss' if built else 'hit')
+            return response
+        return wrapper
+    return decorator
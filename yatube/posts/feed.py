@@ -0,0 +1,243 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import FeedItem, Follow, Post, UserStats
+
+# Сколько последних записей автора попадает в ленту при подписке.
+BACKFILL_LIMIT: int = getattr(settings, 'FEED_BACKFILL_LIMIT', 1000)
+# Сколько строк ленты вставлять за раз при раскладке по всем подписчикам.
+BATCH_SIZE = 1000
+# Поля, по которым сортируется и листается лента подписок.
+FEED_KEYS = ('feed_date', 'feed_id')
+
+
+def pull_threshold():
+    """
+    Число подписчиков, начиная с которого записи автора не раскладываются
+    по лентам, а подмешиваются при чтении.
+    """
+    return getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+
+
+def push_threshold():
+    """
+    Число подписчиков, ниже которого популярный автор снова
+    раскладывается по лентам. Порог ниже pull_threshold: автор на
+    границе не переключается туда и обратно при каждой подписке.
+    """
+    return getattr(settings, 'FEED_PUSH_THRESHOLD',
+                   pull_threshold() * 9 // 10)
+
+
+def is_popular(author_id):
+    """
+    Записи автора подмешиваются при чтении. И запись, и чтение смотрят
+    на один флаг UserStats.pulled; строку счетчиков создает первая же
+    подписка на автора.
+    """
+    return UserStats.objects.filter(user_id=author_id, pulled=True).exists()
+
+
+def popular_authors(user):
+    """Популярные авторы, на которых подписан пользователь."""
+    return Follow.objects.filter(
+        user=user, author__stats__pulled=True,
+    ).values_list('author', flat=True)
+
+
+def promote(author_id=None):
+    """
+    Перевести автора (без author_id - всех) с числом подписчиков от
+    pull_threshold на подмешивание при чтении. Дешево: ленты не
+    трогаются, разложенные записи автора при чтении исключаются.
+    """
+    authors = UserStats.objects.filter(
+        pulled=False, followers__gte=pull_threshold())
+    if author_id is not None:
+        authors = authors.filter(user_id=author_id)
+    return authors.update(pulled=True)
+
+
+def fan_out_post(post):
+    """Разложить новую запись по лентам подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        ignore_conflicts=True,
+    )
+
+
+def add_author(user_id, author_id):
+    """Добавить в ленту подписчика последние записи автора."""
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')[:BACKFILL_LIMIT]
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True,
+    )
+
+
+def remove_author(user_id, author_id):
+    """
+    Убрать из ленты подписчика записи автора. Автора, ставшего
+    непопулярным, возвращает к раскладке команда rebalance_feeds:
+    раскладка по тысячам лент не делается в запросе отписки.
+    """
+    FeedItem.objects.filter(user_id=user_id,
+                            post__author_id=author_id).delete()
+
+
+def to_demote():
+    """Популярные авторы, у которых подписчиков стало меньше push_threshold."""
+    return UserStats.objects.filter(
+        pulled=True, followers__lt=push_threshold()).values_list(
+            'user_id', flat=True)
+
+
+def demote(author_id):
+    """
+    Вернуть автора к раскладке по лентам. Пока флаг pulled стоит,
+    ленты читаются полностью, поэтому последние записи автора сначала
+    раскладываются по лентам всех подписчиков пачками, и только потом
+    флаг снимается. Подписки и записи, появившиеся за это время,
+    раскладываются следом. Возвращает False, если автор за это время
+    снова набрал подписчиков и остался популярным.
+    """
+    last_follow = Follow.objects.filter(author_id=author_id).order_by(
+        '-pk').values_list('pk', flat=True).first() or 0
+    last_post = Post.objects.filter(author_id=author_id).order_by(
+        '-pk').values_list('pk', flat=True).first() or 0
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')[:BACKFILL_LIMIT])
+    followers = Follow.objects.filter(
+        author_id=author_id, pk__lte=last_follow).order_by('pk')
+    # В пачке около BATCH_SIZE строк ленты.
+    step = max(BATCH_SIZE // max(len(posts), 1), 1)
+    last_pk = 0
+    while posts:
+        batch = list(followers.filter(pk__gt=last_pk).values_list(
+            'pk', 'user_id')[:step])
+        if not batch:
+            break
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+             for _, user_id in batch for post_id, pub_date in posts],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        last_pk = batch[-1][0]
+    if not UserStats.objects.filter(
+            user_id=author_id, pulled=True,
+            followers__lt=push_threshold()).update(pulled=False):
+        return False
+    late_follows = Follow.objects.filter(
+        author_id=author_id, pk__gt=last_follow).values_list(
+            'user_id', flat=True)
+    for user_id in late_follows:
+        add_author(user_id, author_id)
+    for post in Post.objects.filter(author_id=author_id, pk__gt=last_post):
+        fan_out_post(post)
+    return True
+
+
+def feed_posts(user):
+    """
+    Записи материализованной ленты пользователя. Ключи FEED_KEYS
+    берутся из таблицы ленты, чтобы сортировка шла по ее индексу.
+    """
+    return Post.objects.filter(feed_items__user=user).annotate(
+        feed_date=F('feed_items__pub_date'),
+        feed_id=F('feed_items__post_id'),
+    )
+
+
+def author_posts(author_id):
+    """Записи одного автора с ключами FEED_KEYS."""
+    return Post.objects.filter(author_id=author_id).annotate(
+        feed_date=F('pub_date'),
+        feed_id=F('id'),
+    )
+
+
+def timeline(user):
+    """
+    Лента подписок: разложенные при записи посты обычных авторов
+    плюс посты популярных авторов, подмешиваемые при чтении
+    (по одному источнику на автора).
+    """
+    popular = list(popular_authors(user))
+    if not popular:
+        return feed_posts(user)
+    return MergedFeed(
+        [feed_posts(user).exclude(author__in=popular)]
+        + [author_posts(author_id) for author_id in popular]
+    )
+
+
+class MergedFeed:
+    """
+    k-way слияние нескольких непересекающихся querysets по (pub_date, id).
+    Поддерживает то подмножество API QuerySet, которое нужно Paginator
+    и CursorPaginator: count, срезы, order_by, filter, reverse.
+    """
+
+    # Срез страницы N берет N страниц из каждого источника и сливает их
+    # в памяти, поэтому по номеру открываются только первые страницы.
+    max_pages = 10
+
+    def __init__(self, querysets, newest_first=True):
+        self.querysets = querysets
+        self.newest_first = newest_first
+        self.ordered = True
+
+    def _clone(self, method, *args, **kwargs):
+        return MergedFeed(
+            [getattr(qs, method)(*args, **kwargs) for qs in self.querysets],
+            self.newest_first,
+        )
+
+    def select_related(self, *fields):
+        return self._clone('select_related', *fields)
+
+    def order_by(self, *fields):
+        return self._clone('order_by', *fields)
+
+    def filter(self, *args, **kwargs):
+        return self._clone('filter', *args, **kwargs)
+
+    def reverse(self):
+        feed = self._clone('reverse')
+        feed.newest_first = not self.newest_first
+        return feed
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        sources = [qs[:stop] if stop is not None else qs
+                   for qs in self.querysets]
+        merged = heapq.merge(
+            *sources,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=self.newest_first,
+        )
+        return list(islice(merged, start, stop))
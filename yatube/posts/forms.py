@@ -1,5 +1,6 @@
 from django import forms
 
+from .images import normalize_image
 from .models import Post, Comment
 
 
@@ -8,6 +9,20 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        """
+        Новая картинка проходит нормализацию, а ее размеры
+        записываются в запись.
+        """
+        image = self.cleaned_data.get('image')
+        if 'image' not in self.changed_data:
+            return image
+        size = (None, None)
+        if image:
+            image, size = normalize_image(image)
+        self.instance.image_width, self.instance.image_height = size
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
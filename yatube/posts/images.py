@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 90
+
+
+def max_side():
+    """Наибольшая сторона сохраняемого оригинала в пикселях."""
+    return getattr(settings, 'IMAGE_MAX_SIDE', 2560)
+
+
+def max_pixels():
+    """Сколько пикселей может быть в загружаемой картинке."""
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 40 * 1000 * 1000)
+
+
+def check_pixels(size):
+    """
+    Отказ от картинок-бомб: размер берется из заголовка файла,
+    пиксели при этом еще не распакованы.
+    """
+    width, height = size
+    if width * height > max_pixels():
+        raise ValidationError(
+            'Слишком большая картинка: %(width)s x %(height)s пикселей.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def unsupported(image_format):
+    """Ошибка для формата, который не получится сохранить."""
+    return ValidationError(
+        'Картинки в формате %(format)s не поддерживаются.',
+        code='unsupported_format',
+        params={'format': image_format},
+    )
+
+
+def strip_animation(source, name):
+    """
+    Анимация пересохраняется кадр в кадр, но без EXIF и прочих
+    метаданных: в них бывают координаты съемки. Размер кадров
+    не меняется.
+    """
+    if source.format not in Image.SAVE_ALL:
+        raise unsupported(source.format)
+    output = tempfile.TemporaryFile()
+    source.save(output, format=source.format, save_all=True, exif=b'')
+    output.seek(0)
+    return File(output, name=name)
+
+
+def normalize_image(upload):
+    """
+    Оригинал для хранения: с учетом ориентации из EXIF, без метаданных
+    и уменьшенный до IMAGE_MAX_SIDE. Результат пишется во временный
+    файл на диске. Возвращает файл и его размеры. У анимации только
+    убираются метаданные; снимок камеры из нескольких кадров (MPO)
+    хранится как JPEG из основного кадра. Форматы, которые Pillow
+    не умеет записывать, не принимаются.
+    """
+    upload.seek(0)
+    name = upload.name
+    with Image.open(upload) as source:
+        check_pixels(source.size)
+        image_format = source.format
+        if image_format == 'MPO':
+            # Pillow открывает MPO как анимацию; первый кадр - сам снимок.
+            source.seek(0)
+            image_format = 'JPEG'
+            name = os.path.splitext(name)[0] + '.jpg'
+        elif getattr(source, 'is_animated', False):
+            return strip_animation(source, name), source.size
+        if image_format not in Image.SAVE:
+            raise unsupported(image_format)
+        limit = (max_side(), max_side())
+        # JPEG сразу декодируется в уменьшенном масштабе.
+        source.draft(source.mode, limit)
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail(limit)
+    options = {'exif': b''}
+    if image_format == 'JPEG':
+        options.update(quality=JPEG_QUALITY, optimize=True)
+    output = tempfile.TemporaryFile()
+    image.save(output, format=image_format, **options)
+    output.seek(0)
+    return File(output, name=name), image.size
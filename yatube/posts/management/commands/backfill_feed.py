@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.models import FeedItem, Follow
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам (Follow)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Предварительно очистить все ленты',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            FeedItem.objects.all().delete()
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        count = 0
+        for user_id, author_id in follows.iterator():
+            feed.add_author(user_id, author_id)
+            count += 1
+        self.stdout.write(f'Обработано подписок: {count}')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import media
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки записей, на которые не осталось ссылок, '
+            'вместе с их миниатюрами')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help='Не трогать файлы, потерявшие ссылки позже стольких секунд',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов удалять за один проход',
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Предварительно пересчитать ссылки по записям и диску',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            media.recount()
+        removed = 0
+        while True:
+            batch = list(media.orphans(options['grace'])[
+                :options['batch_size']])
+            if not batch:
+                break
+            removed += media.collect(batch, options['grace'])
+        self.stdout.write(f'Удалено файлов: {removed}')
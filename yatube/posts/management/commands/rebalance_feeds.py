@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ('Переключает авторов между раскладкой записей по лентам '
+            'подписок и подмешиванием при чтении по числу подписчиков')
+
+    def handle(self, *args, **options):
+        promoted = feed.promote()
+        demoted = sum(feed.demote(author_id)
+                      for author_id in list(feed.to_demote()))
+        self.stdout.write(f'Подмешиваются при чтении: {promoted}, '
+                          f'снова раскладываются: {demoted}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики пользователей (UserStats) с записями в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько пользователей сверять за один проход',
+        )
+
+    def handle(self, *args, **options):
+        fixed = checked = 0
+        last_pk = 0
+        while True:
+            user_ids = list(User.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not user_ids:
+                break
+            fixed += stats.reconcile(user_ids)
+            checked += len(user_ids)
+            last_pk = user_ids[-1]
+        self.stdout.write(f'Проверено: {checked}, исправлено: {fixed}')
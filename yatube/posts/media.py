@@ -0,0 +1,135 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaFile, Post
+from .storage import image_storage, is_hashed
+
+# Сколько секунд живет блокировка имени файла.
+LOCK_TIMEOUT = 30
+
+
+@contextmanager
+def file_lock(name, wait=True):
+    """
+    Блокировка имени файла в общем кэше: загрузка того же содержимого
+    и collect_media не работают с одним файлом одновременно. Без wait
+    не ждет чужую блокировку; внутри блока - взята ли она.
+    """
+    key = f'media.{name}.lock'
+    while not cache.add(key, True, LOCK_TIMEOUT):
+        if not wait:
+            yield False
+            return
+        time.sleep(0.05)
+    try:
+        yield True
+    finally:
+        cache.delete(key)
+
+
+def add_ref(name):
+    """Еще одна запись ссылается на файл картинки."""
+    if is_hashed(name):
+        MediaFile.objects.get_or_create(name=name)
+        MediaFile.objects.filter(name=name).update(
+            refs=F('refs') + 1, updated=timezone.now())
+
+
+def touch(name):
+    """
+    Файл только что записан или переиспользован загрузкой: collect_media
+    не трогает его еще grace секунд, даже если ссылок пока нет.
+    """
+    if is_hashed(name):
+        if not MediaFile.objects.filter(name=name).update(
+                updated=timezone.now()):
+            MediaFile.objects.get_or_create(name=name)
+
+
+def drop_ref(name):
+    """Запись больше не ссылается на файл картинки."""
+    if is_hashed(name):
+        MediaFile.objects.filter(name=name, refs__gt=0).update(
+            refs=F('refs') - 1, updated=timezone.now())
+
+
+def stored_names(directory='posts'):
+    """Имена всех файлов ContentHashStorage в directory."""
+    directories, files = image_storage.listdir(directory)
+    for name in files:
+        name = os.path.join(directory, name)
+        if is_hashed(name):
+            yield name
+    for subdirectory in directories:
+        yield from stored_names(os.path.join(directory, subdirectory))
+
+
+def recount():
+    """
+    Пересчитать ссылки по таблице записей: правки мимо save(),
+    например QuerySet.update(), счетчики не видят. Файлы на диске,
+    о которых счетчики не знают, тоже попадают в учет.
+    """
+    names = set(Post.objects.exclude(image='').values_list(
+        'image', flat=True).distinct().iterator())
+    if image_storage.exists('posts'):
+        names.update(stored_names())
+    known = set(MediaFile.objects.values_list('name', flat=True))
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name) for name in names - known if is_hashed(name)],
+        ignore_conflicts=True)
+    refs = Post.objects.filter(image=OuterRef('name')).order_by().values(
+        'image').annotate(refs=Count('pk')).values('refs')
+    MediaFile.objects.update(refs=Coalesce(Subquery(refs), 0))
+
+
+def orphans(grace):
+    """
+    Имена файлов без ссылок, не менявшихся grace секунд: свежий файл
+    без ссылки может принадлежать записи, которая еще сохраняется.
+    """
+    since = timezone.now() - timedelta(seconds=grace)
+    return MediaFile.objects.filter(refs=0, updated__lt=since).values_list(
+        'name', flat=True)
+
+
+def remove_file(name):
+    """Удалить оригинал и все его миниатюры."""
+    default.kvstore.delete(ImageFile(name, image_storage))
+    image_storage.delete(name)
+
+
+def collect(names, grace):
+    """
+    Удалить файлы из names, на которые так и не появилось ссылок
+    и которые за grace секунд не переиспользовала новая загрузка.
+    Возвращает число удаленных файлов.
+    """
+    since = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    for name in names:
+        with file_lock(name, wait=False) as locked:
+            # Файл сейчас загружают снова: он нужен, разберемся в
+            # следующий раз.
+            if not locked:
+                continue
+            # Файл удаляется в транзакции, удалившей строку: touch()
+            # загрузки из другого процесса ждет ее конца и уже не
+            # застанет файл на диске, даже если кэш у процессов свой.
+            with transaction.atomic():
+                deleted, _ = MediaFile.objects.filter(
+                    name=name, refs=0, updated__lt=since).delete()
+                if deleted:
+                    remove_file(name)
+                    removed += 1
+    return removed
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('posts', 'UserStats')
+    sources = {
+        'posts': (apps.get_model('posts', 'Post'), 'author'),
+        'comments': (apps.get_model('posts', 'Comment'), 'author'),
+        'followers': (apps.get_model('posts', 'Follow'), 'author'),
+        'following': (apps.get_model('posts', 'Follow'), 'user'),
+    }
+    counts = {
+        field: dict(model.objects.values_list(user_field).annotate(
+            total=Count('pk')).order_by())
+        for field, (model, user_field) in sources.items()
+    }
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id, **{field: counts[field].get(user_id, 0)
+                                       for field in sources})
+         for user_id in User.objects.values_list('pk', flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_auto_20261018_0342'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('comments', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    threshold = getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+    UserStats.objects.filter(followers__gte=threshold).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='pulled',
+            field=models.BooleanField(default=False, verbose_name='Подмешивается в ленты'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -40,7 +42,25 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=image_storage,
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    comment_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False,
     )
 
     def __str__(self):
@@ -48,6 +68,13 @@ class Post(models.Model):
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -75,6 +102,12 @@ class Comment(models.Model):
         verbose_name='Сообщение',
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
@@ -98,9 +131,100 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='not_unique_set_author_user')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return (f'Автор {self.author.get_username} '
                 f'- подписчик {self.user.get_username}')
+
+
+class FeedItem(models.Model):
+    """
+    Запись в материализованной ленте подписок пользователя.
+    Заполняется при публикации поста (fan-out-on-write).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Сообщение',
+        related_name='feed_items',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_user_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='feed_user_pub_date_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class MediaFile(models.Model):
+    """
+    Файл картинки в ContentHashStorage и число записей, которые на него
+    ссылаются. Файлы без ссылок удаляет команда collect_media.
+    """
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    updated = models.DateTimeField('Изменен', auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refs', 'updated'],
+                         name='media_refs_updated_idx'),
+        ]
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+
+class UserStats(models.Model):
+    """
+    Счетчики пользователя для профиля и страницы записи. Меняются
+    сигналами вместе с записями, комментариями и подписками;
+    расхождения исправляет команда reconcile_stats.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Пользователь',
+        related_name='stats',
+    )
+    posts = models.PositiveIntegerField('Записей', default=0)
+    comments = models.PositiveIntegerField('Комментариев', default=0)
+    followers = models.PositiveIntegerField('Подписчиков', default=0)
+    following = models.PositiveIntegerField('Подписок', default=0)
+    # Записи автора не раскладываются по лентам, а подмешиваются при
+    # чтении. Флаг меняют posts.feed.promote и команда rebalance_feeds.
+    pulled = models.BooleanField('Подмешивается в ленты', default=False)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
@@ -0,0 +1,128 @@
+import datetime
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Допустимые значения курсора: даты, которые представимы в datetime,
+# и id в пределах INTEGER SQLite (int64).
+MIN_MICRO = (datetime.datetime.min.replace(tzinfo=timezone.utc)
+             - EPOCH) // datetime.timedelta(microseconds=1)
+MAX_MICRO = (datetime.datetime.max.replace(tzinfo=timezone.utc)
+             - EPOCH) // datetime.timedelta(microseconds=1)
+MAX_PK = 2 ** 63 - 1
+
+
+def encode_cursor(obj, keys=('pub_date', 'id')):
+    """Курсор объекта: микросекунды поля даты и id через точку."""
+    date_key, id_key = keys
+    delta = getattr(obj, date_key) - EPOCH
+    micro = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+    return f'{micro}.{getattr(obj, id_key)}'
+
+
+def decode_cursor(cursor):
+    """Разбор курсора; для испорченного значения возвращает None."""
+    try:
+        micro, pk = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    if not MIN_MICRO <= micro <= MAX_MICRO or not 0 <= pk <= MAX_PK:
+        return None
+    try:
+        return EPOCH + datetime.timedelta(microseconds=micro), pk
+    except OverflowError:
+        return None
+
+
+class ShallowPaginator(Paginator):
+    """
+    Paginator, который по номеру открывает только первые max_pages
+    страниц: более далекий номер дает страницу max_pages, дальше
+    листают по курсору.
+    """
+
+    def __init__(self, object_list, per_page, max_pages):
+        super().__init__(object_list, per_page)
+        self.max_pages = max_pages
+
+    def page(self, number):
+        return super().page(min(self.validate_number(number),
+                                self.max_pages))
+
+
+class CursorPage(Page):
+    """Страница ленты, построенная по курсору, а не по номеру."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.previous_cursor}:{self.next_cursor}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """
+    Keyset-пагинация по (дата, id), по умолчанию (pub_date, id):
+    страница выбирается условием WHERE по курсору, поэтому не нужны
+    ни COUNT(*), ни OFFSET.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id')):
+        self.date_key, self.id_key = keys
+        super().__init__(
+            object_list.order_by(f'-{self.date_key}', f'-{self.id_key}'),
+            per_page,
+        )
+
+    def _older(self, cursor):
+        pub_date, pk = cursor
+        return (Q(**{f'{self.date_key}__lt': pub_date})
+                | Q(**{self.date_key: pub_date, f'{self.id_key}__lt': pk}))
+
+    def _newer(self, cursor):
+        pub_date, pk = cursor
+        return (Q(**{f'{self.date_key}__gt': pub_date})
+                | Q(**{self.date_key: pub_date, f'{self.id_key}__gt': pk}))
+
+    def _page(self, rows, newer_exists, older_exists):
+        keys = (self.date_key, self.id_key)
+        next_cursor = previous_cursor = None
+        if rows and older_exists:
+            next_cursor = encode_cursor(rows[-1], keys)
+        if rows and newer_exists:
+            previous_cursor = encode_cursor(rows[0], keys)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def first_page(self):
+        """Самые свежие записи ленты."""
+        rows = list(self.object_list[:self.per_page + 1])
+        return self._page(rows[:self.per_page], False,
+                          len(rows) > self.per_page)
+
+    def page_after(self, cursor):
+        """Страница записей старше курсора."""
+        rows = list(
+            self.object_list.filter(self._older(cursor))[:self.per_page + 1])
+        return self._page(rows[:self.per_page], True,
+                          len(rows) > self.per_page)
+
+    def page_before(self, cursor):
+        """Страница записей новее курсора."""
+        rows = list(self.object_list.filter(
+            self._newer(cursor)).reverse()[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            return self.first_page()
+        return self._page(rows[:self.per_page][::-1], True, True)
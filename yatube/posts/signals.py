@@ -0,0 +1,163 @@
+from django.core.signals import request_finished
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import feed, media, stats, thumbnails
+from .cache import bump, bump_tags, post_tags, tag
+from .models import Comment, Follow, Group, Post, User
+
+INDEX_PAGE = 'index_page'
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    """Новая запись попадает в ленты подписчиков."""
+    if created:
+        feed.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_index(sender, update_fields=None, **kwargs):
+    """Изменение записей, групп и авторов сбрасывает кэш главной."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump(INDEX_PAGE)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, **kwargs):
+    """
+    Запоминаем прежние группу и картинку: страница группы тоже устареет,
+    а на старый файл станет меньше ссылок.
+    """
+    instance._old_group_id, instance._old_image = None, ''
+    if instance.pk is not None:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image').first()
+        if previous is not None:
+            instance._old_group_id, instance._old_image = previous
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_tags(sender, instance, **kwargs):
+    tags = post_tags([instance])
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id:
+        tags.add(tag('group', old_group_id))
+    bump_tags(*tags)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    """Новая картинка записи получает ссылку, прежняя ее теряет."""
+    old_image = getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        media.add_ref(instance.image.name)
+        media.drop_ref(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    media.drop_ref(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    """Счетчик комментариев записи меняется одним UPDATE."""
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_tags(sender, instance, **kwargs):
+    bump_tags(tag('post', instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_tags(sender, instance, **kwargs):
+    bump_tags(tag('author', instance.author_id),
+              tag('author', instance.user_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_tags(sender, instance, **kwargs):
+    bump_tags(tag('group', instance.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author_tags(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_tags(tag('author', instance.pk))
+
+
+@receiver(request_finished)
+def thumbnails_after_response(sender, **kwargs):
+    """WSGI-сервер закрывает ответ после отправки: пора делать миниатюры."""
+    thumbnails.generate_pending()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def count_created(sender, instance, created, **kwargs):
+    """Новая запись или комментарий увеличивают счетчик автора."""
+    if created:
+        field = 'posts' if sender is Post else 'comments'
+        stats.change(instance.author_id, **{field: 1})
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def count_deleted(sender, instance, **kwargs):
+    field = 'posts' if sender is Post else 'comments'
+    stats.change(instance.author_id, **{field: -1})
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        stats.change(instance.author_id, followers=1)
+        stats.change(instance.user_id, following=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    stats.change(instance.author_id, followers=-1)
+    stats.change(instance.user_id, following=-1)
+
+
+# Ленты подписок подключаются после счетчиков: популярность автора
+# определяется по UserStats.followers, уже учитывающему подписку.
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    """
+    При подписке лента пополняется записями автора. Автор, набравший
+    pull_threshold подписчиков, сразу переходит на подмешивание.
+    """
+    if created:
+        feed.promote(instance.author_id)
+        feed.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_trim(sender, instance, **kwargs):
+    """При отписке записи автора убираются из ленты."""
+    feed.remove_author(instance.user_id, instance.author_id)
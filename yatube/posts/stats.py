@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+# Счетчик UserStats -> (модель, поле со ссылкой на пользователя).
+SOURCES = {
+    'posts': (Post, 'author'),
+    'comments': (Comment, 'author'),
+    'followers': (Follow, 'author'),
+    'following': (Follow, 'user'),
+}
+
+
+def counted(field):
+    """Подзапрос: сколько строк источника счетчика у пользователя."""
+    model, user_field = SOURCES[field]
+    return Coalesce(Subquery(
+        model.objects.filter(**{user_field: OuterRef('pk')}).order_by()
+        .values(user_field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def actual_counts(user_ids):
+    """Настоящие счетчики пользователей одним запросом: {id: {...}}."""
+    # У User уже есть связи posts и following: аннотации с префиксом.
+    rows = User.objects.filter(pk__in=user_ids).annotate(
+        **{f'total_{field}': counted(field) for field in SOURCES}
+    ).values_list('pk', *(f'total_{field}' for field in SOURCES))
+    return {pk: dict(zip(SOURCES, totals)) for pk, *totals in rows}
+
+
+def change(user_id, **deltas):
+    """
+    Сдвинуть счетчики пользователя одним UPDATE. Если строки еще нет,
+    она создается с настоящими значениями, которые уже учитывают
+    изменение. Уменьшение строку не создает: пользователь может
+    удаляться каскадом прямо сейчас.
+    """
+    # Счетчик не уходит ниже нуля, даже если он уже разошелся с БД.
+    floors = {f'{field}__gte': -delta
+              for field, delta in deltas.items() if delta < 0}
+    with transaction.atomic():
+        updated = UserStats.objects.filter(user_id=user_id, **floors).update(
+            **{field: F(field) + delta for field, delta in deltas.items()})
+        if updated or min(deltas.values()) < 0:
+            return
+        counts = actual_counts([user_id]).get(user_id)
+        if counts is not None:
+            UserStats.objects.get_or_create(user_id=user_id, defaults=counts)
+
+
+def stats_for(user):
+    """Счетчики пользователя; для старых пользователей строка создается."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        counts = actual_counts([user.pk])[user.pk]
+        stats, _ = UserStats.objects.get_or_create(user=user, defaults=counts)
+        return stats
+
+
+def reconcile(user_ids):
+    """
+    Сверить счетчики пользователей с таблицами и исправить расхождения.
+    Возвращает число исправленных строк.
+    """
+    actual = actual_counts(user_ids)
+    stored = UserStats.objects.in_bulk(list(actual))
+    fixed, missing = [], []
+    for user_id, counts in actual.items():
+        stats = stored.get(user_id)
+        if stats is None:
+            missing.append(UserStats(user_id=user_id, **counts))
+        elif any(getattr(stats, field) != value
+                 for field, value in counts.items()):
+            for field, value in counts.items():
+                setattr(stats, field, value)
+            fixed.append(stats)
+    with transaction.atomic():
+        UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+        UserStats.objects.bulk_update(fixed, list(SOURCES))
+    return len(fixed) + len(missing)
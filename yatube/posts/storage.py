@@ -0,0 +1,77 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(
+    r'^(.+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_hashed(name):
+    """Имя выдано ContentHashStorage."""
+    return bool(name) and HASHED_NAME.match(name) is not None
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    Файлы называются по SHA-256 содержимого: posts/ab/cd/abcd...ef.jpg.
+    Одинаковые загрузки ложатся в один файл, повторно он не пишется.
+    Имя не меняется, пока не меняется содержимое, поэтому такие файлы
+    можно кэшировать навсегда. Сколько записей ссылается на файл,
+    считает posts.media.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменяется хэшем в _save.
+        return name
+
+    def _save(self, name, content):
+        # posts.media импортирует модели, а модели - этот модуль.
+        from .media import file_lock, touch
+
+        name = self.hashed_name(name, content)
+        # Отметка под блокировкой имени и до проверки файла: collect_media
+        # не удалит файл, который сейчас переиспользуется или пишется.
+        with file_lock(name):
+            touch(name)
+            if not self.exists(name):
+                self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        # Пишем во временный файл рядом и атомарно переименовываем:
+        # два процесса с одинаковой загрузкой не испортят друг другу файл.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+image_storage = ContentHashStorage()
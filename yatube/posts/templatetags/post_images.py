@@ -0,0 +1,50 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..thumbnails import resolve_thumbnails
+
+register = template.Library()
+
+# Карточка занимает всю ширину контейнера, но не больше 960px.
+CARD_SIZES = '(min-width: 960px) 960px, 100vw'
+
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def srcset(variants):
+    return format_html_join(', ', '{} {}w', (
+        (thumbnail.url, width) for width, thumbnail in variants))
+
+
+@register.simple_tag
+def card_image(post, css_class='card-img my-2', sizes=CARD_SIZES):
+    """
+    Картинка записи в <picture>: WebP-варианты для браузеров, которые
+    его понимают, и JPEG в нескольких ширинах для остальных. Браузер
+    выбирает ширину по sizes и грузит картинку, только когда до нее
+    доходит прокрутка. Пока миниатюры не готовы, выводится оригинал.
+    """
+    if not hasattr(post, 'srcsets'):
+        resolve_thumbnails([post])
+    if post.thumbnail is None:
+        return ''
+    if not post.srcsets:
+        return format_html(
+            '<img class="{}" src="{}" width="{}" height="{}" alt="" '
+            'loading="lazy" decoding="async">',
+            css_class, post.thumbnail.url,
+            post.thumbnail.width, post.thumbnail.height,
+        )
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[image_format], srcset(variants), sizes)
+         for image_format, variants in post.srcsets.items()
+         if image_format != 'JPEG'))
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" alt="" loading="lazy" decoding="async">'
+        '</picture>',
+        sources, css_class, post.thumbnail.url,
+        srcset(post.srcsets['JPEG']), sizes,
+        post.thumbnail.width, post.thumbnail.height,
+    )
@@ -1,17 +1,84 @@
+import os
 import shutil
+import struct
 import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
 
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
 from django.urls import reverse
-from ..models import Post, User
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
+from .. import media, views
+from ..models import MediaFile, Post, User
+from ..storage import image_storage, is_hashed
+from ..thumbnails import card_variants, thumbnail_file
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def make_jpeg(size):
+    """JPEG с EXIF: камера и поворот на 90 градусов."""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    exif[0x0112] = 6
+    content = BytesIO()
+    Image.new('RGB', size, 'red').save(content, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name='photo.jpg',
+                              content=content.getvalue(),
+                              content_type='image/jpeg')
+
+
+def make_mpo(size):
+    """
+    MPO, как его пишут камеры: JPEG с EXIF и вторым кадром,
+    описанным в сегменте APP2 "MPF".
+    """
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    exif[0x0112] = 6
+    first, second = BytesIO(), BytesIO()
+    Image.new('RGB', size, 'red').save(first, 'JPEG', exif=exif)
+    Image.new('RGB', size, 'blue').save(second, 'JPEG')
+    first, second = first.getvalue(), second.getvalue()
+    header = b'MM\x00\x2a' + struct.pack('>I', 8)
+    ifd = struct.pack('>H', 3)
+    ifd += struct.pack('>HHI4s', 0xB000, 7, 4, b'0100')
+    ifd += struct.pack('>HHII', 0xB001, 4, 1, 2)
+    ifd += struct.pack('>HHII', 0xB002, 7, 32, len(header) + len(ifd) + 16)
+    ifd += struct.pack('>I', 0)
+    payload_size = 4 + len(header) + len(ifd) + 32
+    first_size = len(first) + 4 + payload_size
+    # Смещение второго кадра считается от заголовка TIFF внутри APP2.
+    entries = struct.pack('>IIIHH', 0x20030000, first_size, 0, 0, 0)
+    entries += struct.pack('>IIIHH', 0, len(second), first_size - 8, 0, 0)
+    payload = b'MPF\x00' + header + ifd + entries
+    app2 = b'\xff\xe2' + struct.pack('>H', len(payload) + 2) + payload
+    return SimpleUploadedFile(name='photo.mpo',
+                              content=first[:2] + app2 + first[2:] + second,
+                              content_type='image/jpeg')
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class CreateFormTests(TestCase):
@@ -60,9 +127,174 @@ class CreateFormTests(TestCase):
         self.authorized_test_user.post(reverse('posts:post_create'),
                                        data=form_data, follow=True)
 
-        self.assertTrue(Post.objects.filter(image='posts/small.gif').exists())
+        post = Post.objects.get(text='Тестовый текст')
+        self.assertTrue(is_hashed(post.image.name))
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertTrue(post.image.name.endswith('.gif'))
         self.assertNotEqual(Post.objects.count(), post_count)
 
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_image_normalized(self):
+        """
+        Картинка поворачивается по EXIF, теряет метаданные,
+        уменьшается до IMAGE_MAX_SIDE, а размеры сохраняются в записи.
+        """
+
+        form_data = {'text': 'Фото', 'image': make_jpeg((400, 200))}
+        self.authorized_test_user.post(reverse('posts:post_create'),
+                                       data=form_data, follow=True)
+
+        post = Post.objects.get(text='Фото')
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(dict(image.getexif()), {})
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_mpo_saved_as_jpeg(self):
+        """Снимок MPO хранится как JPEG из первого кадра без EXIF."""
+
+        form_data = {'text': 'Стерео', 'image': make_mpo((400, 200))}
+        self.authorized_test_user.post(reverse('posts:post_create'),
+                                       data=form_data)
+
+        post = Post.objects.get(text='Стерео')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_animation_metadata_stripped(self):
+        """У анимации остаются все кадры, но пропадает EXIF."""
+
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        content = BytesIO()
+        frames = [Image.new('RGB', (20, 10), color)
+                  for color in ('red', 'blue')]
+        frames[0].save(content, 'PNG', save_all=True,
+                       append_images=frames[1:], exif=exif)
+        uploaded = SimpleUploadedFile(name='moving.png',
+                                      content=content.getvalue(),
+                                      content_type='image/png')
+        self.authorized_test_user.post(
+            reverse('posts:post_create'),
+            data={'text': 'Анимация', 'image': uploaded})
+
+        post = Post.objects.get(text='Анимация')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.n_frames, 2)
+            self.assertEqual(dict(image.getexif()), {})
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_decompression_bomb_rejected(self):
+        """Картинка с большим числом пикселей не принимается."""
+
+        form_data = {'text': 'Бомба', 'image': make_jpeg((100, 100))}
+        response = self.authorized_test_user.post(
+            reverse('posts:post_create'), data=form_data)
+
+        self.assertFormError(response, 'form', 'image',
+                             'Слишком большая картинка: 100 x 100 пикселей.')
+        self.assertFalse(Post.objects.filter(text='Бомба').exists())
+
+    def test_thumbnails_backfill(self):
+        """Команда generate_thumbnails создает миниатюры картинок."""
+
+        uploaded = SimpleUploadedFile(
+            name='backfill.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        Post.objects.create(text='Тестовый текст!',
+                            author=CreateFormTests.test_user,
+                            image=uploaded)
+
+        call_command('generate_thumbnails', stdout=StringIO())
+
+        thumbnails = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertTrue(any(files for _, _, files in os.walk(thumbnails)))
+
+    def test_duplicate_images_share_file(self):
+        """
+        Одинаковые картинки хранятся одним файлом со счетчиком ссылок,
+        а collect_media удаляет файл без ссылок вместе с миниатюрами
+        """
+
+        posts = [
+            Post.objects.create(
+                text=f'Дубль {i}', author=CreateFormTests.test_user,
+                image=SimpleUploadedFile(name=f'copy{i}.gif',
+                                         content=SMALL_GIF,
+                                         content_type='image/gif'))
+            for i in range(2)
+        ]
+        name = posts[0].image.name
+        self.assertEqual(posts[1].image.name, name)
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
+        call_command('generate_thumbnails', stdout=StringIO())
+        thumbnails = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        count_thumbnails = sum(
+            len(files) for _, _, files in os.walk(thumbnails))
+
+        posts[0].delete()
+        call_command('collect_media', grace=0, recount=True,
+                     stdout=StringIO())
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+        self.assertTrue(image_storage.exists(name))
+
+        posts[1].image = None
+        posts[1].save()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 0)
+        call_command('collect_media', grace=0, stdout=StringIO())
+
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+        self.assertEqual(
+            sum(len(files) for _, _, files in os.walk(thumbnails)),
+            count_thumbnails - len(card_variants()))
+
+    def test_reused_file_survives_collect(self):
+        """
+        Файл, который переиспользовала новая загрузка, не удаляется,
+        даже если уже попал в список сирот
+        """
+
+        post = Post.objects.create(
+            text='Сирота', author=CreateFormTests.test_user,
+            image=SimpleUploadedFile(name='orphan.gif', content=SMALL_GIF,
+                                     content_type='image/gif'))
+        name = post.image.name
+        post.delete()
+        MediaFile.objects.filter(name=name).update(
+            updated=timezone.now() - timedelta(hours=2))
+        batch = list(media.orphans(3600))
+        self.assertEqual(batch, [name])
+
+        image_storage.save('posts/again.gif', ContentFile(SMALL_GIF))
+
+        self.assertEqual(media.collect(batch, 3600), 0)
+        self.assertTrue(image_storage.exists(name))
+        self.assertTrue(MediaFile.objects.filter(name=name).exists())
+
+    def test_collect_skips_locked_file(self):
+        """Файл, который сейчас загружают снова, collect не трогает"""
+
+        post = Post.objects.create(
+            text='Сирота', author=CreateFormTests.test_user,
+            image=SimpleUploadedFile(name='locked.gif', content=SMALL_GIF,
+                                     content_type='image/gif'))
+        name = post.image.name
+        post.delete()
+
+        with media.file_lock(name):
+            self.assertEqual(media.collect([name], 0), 0)
+        self.assertTrue(image_storage.exists(name))
+
+        self.assertEqual(media.collect([name], 0), 1)
+        self.assertFalse(image_storage.exists(name))
+
     def test_form_edits_post(self):
         """Проверяем, что валидная форма изменяет запись."""
 
@@ -91,3 +323,62 @@ class CreateFormTests(TestCase):
                             data=form_data, follow=True)
 
         self.assertNotEqual(User.objects.count(), count_users)
+
+
+class ThumbnailsAfterResponseTest(TransactionTestCase):
+    """Миниатюры новой записи создаются после коммита и ответа."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.user = User.objects.create_user(username='Leo')
+        self.client.force_login(self.user)
+
+    def test_post_create_builds_every_variant(self):
+        """После создания записи через форму есть все варианты миниатюр"""
+
+        self.client.post(reverse('posts:post_create'),
+                         data={'text': 'С картинкой',
+                               'image': make_jpeg((400, 300))})
+
+        post = Post.objects.get()
+        for variant in card_variants():
+            with self.subTest(variant=variant):
+                thumbnail = thumbnail_file(post.image, variant.geometry,
+                                           variant.options)
+                self.assertIsNotNone(default.kvstore.get(thumbnail))
+                self.assertTrue(default.storage.exists(thumbnail.name))
+
+    def test_nothing_built_before_response(self):
+        """Пока ответ не отдан, миниатюры не создаются"""
+
+        request = RequestFactory().post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': make_jpeg((400, 300))})
+        request.user = self.user
+        views.post_create(request)
+
+        post = Post.objects.get()
+        variant = card_variants()[0]
+        thumbnail = thumbnail_file(post.image, variant.geometry,
+                                   variant.options)
+        self.assertIsNone(default.kvstore.get(thumbnail))
+        request_finished.send(sender=self.__class__)
+        self.assertIsNotNone(default.kvstore.get(thumbnail))
+
+    def test_failure_logged(self):
+        """Сбой создания миниатюр пишется в лог и не ломает ответ"""
+
+        with mock.patch('posts.thumbnails.generate_thumbnails',
+                        side_effect=OSError):
+            with self.assertLogs('posts.thumbnails', 'ERROR'):
+                response = self.client.post(
+                    reverse('posts:post_create'),
+                    data={'text': 'С картинкой',
+                          'image': make_jpeg((400, 300))})
+
+        self.assertEqual(response.status_code, 302)
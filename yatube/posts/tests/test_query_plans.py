@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def query_plan(sql):
+    """EXPLAIN QUERY PLAN для запроса SQLite."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTest(TestCase):
+    """
+    Запросы view-функций posts к таблицам приложения идут по индексам
+    и не сортируются во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.group = Group.objects.create(
+            title='Тестовое название группы!',
+            description='Тестовое описание группы!',
+            slug='test_slug')
+
+        cls.user = User.objects.create_user(username='Max')
+        cls.author = User.objects.create_user(username='Leo')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+        for i in range(15):
+            cls.post = Post.objects.create(
+                text='Тестовый текст!',
+                group=cls.group,
+                author=cls.author,)
+        Comment.objects.create(text='Комментарий!', author=cls.user,
+                               post=cls.post)
+
+    def setUp(self):
+        self.authorized_user = Client(self.user)
+        self.authorized_user.force_login(self.user)
+        cache.clear()
+
+    def assert_indexed(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_user.get(url)
+        for query in queries:
+            if 'posts_' not in query['sql']:
+                continue
+            for step in query_plan(query['sql']):
+                with self.subTest(url=url, sql=query['sql'], step=step):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    # SCAN subquery - обход результата подзапроса
+                    # (COUNT по annotate), шаги подзапроса проверены отдельно.
+                    if (step.startswith('SCAN')
+                            and not step.startswith('SCAN subquery')):
+                        self.assertIn('USING', step)
+
+    def test_views_use_indexes(self):
+        """Проверка планов запросов для всех лент и страницы поста"""
+
+        page = self.authorized_user.get(
+            reverse('posts:index')).context['page_obj']
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:index') + f'?after={page.next_cursor}',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:profile', kwargs={'username': self.author})
+            + f'?after={page.next_cursor}',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + f'?after={page.next_cursor}',
+        )
+        for url in urls:
+            self.assert_indexed(url)
@@ -1,6 +1,11 @@
 import shutil
 import tempfile
+import time
+from hashlib import md5
+from io import StringIO
+from unittest import mock
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from django.test import TestCase, Client, override_settings
@@ -8,8 +13,21 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
-
-from ..models import Post, Group, Comment, Follow
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+
+from core.testing import QueryBudgetMixin
+
+from ..feed import MergedFeed
+from ..models import Post, Group, Comment, FeedItem, Follow, UserStats
+from .. import urls
+from ..storage import image_storage
+from ..thumbnails import (CARD_WIDTHS, card_formats, card_variants,
+                          generate_thumbnails, lock_key, lock_waits,
+                          thumbnail_file)
+from ..views import COMMENTS_PAGE
 
 User = get_user_model()
 
@@ -103,6 +121,8 @@ class PageContextTest(TestCase):
             group=cls.group,
             author=cls.test_user_author,
             image=uploaded)
+        cls.image_name = image_storage.hashed_name(
+            'posts/small.gif', ContentFile(small_gif))
 
     @classmethod
     def tearDownClass(cls):
@@ -139,12 +159,105 @@ class PageContextTest(TestCase):
         detail = response_detail.context['post'].image
 
         self.assertTrue(Post.objects.filter(
-                        image='posts/small.gif').exists())
+                        image=self.image_name).exists())
         self.assertEqual(index, self.post.image)
         self.assertEqual(group, self.post.image)
         self.assertEqual(profile, self.post.image)
         self.assertEqual(detail, self.post.image)
 
+    def test_thumbnails_resolved_in_batch(self):
+        """
+        Миниатюры ленты берутся одним get_many и одним запросом к БД
+        без обращений к хранилищу на каждую карточку
+        """
+
+        call_command('generate_thumbnails', stdout=StringIO())
+        cache.clear()
+        url = reverse('posts:follow_index')
+        Follow.objects.create(user=self.test_user_author,
+                              author=self.test_user_author)
+
+        with mock.patch.object(default.kvstore, 'get',
+                               side_effect=AssertionError):
+            response = self.authorized_author.get(url)
+            thumbnail = response.context['page_obj'][0].thumbnail
+            self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+            self.assertContains(response, thumbnail.url)
+
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_author.get(reverse('posts:index'))
+            kvstore = [query for query in queries.captured_queries
+                       if 'thumbnail_kvstore' in query['sql']]
+            self.assertEqual(kvstore, [])
+
+    def test_responsive_card_image(self):
+        """
+        Картинка записи отдается вариантами разной ширины во всех
+        форматах миниатюр и грузится лениво
+        """
+
+        response = self.authorized_author.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+
+        self.assertEqual(set(post.srcsets), set(card_formats()))
+        for image_format, variants in post.srcsets.items():
+            with self.subTest(image_format=image_format):
+                self.assertEqual([width for width, _ in variants],
+                                 list(CARD_WIDTHS))
+                for width, thumbnail in variants:
+                    self.assertEqual(thumbnail.width, width)
+                    self.assertContains(response, f'{thumbnail.url} {width}w')
+        self.assertContains(response, 'loading="lazy" decoding="async"')
+        if 'WEBP' in post.srcsets:
+            self.assertContains(response, '<source type="image/webp"')
+
+    @override_settings(THUMBNAIL_BUILD_WAIT=0)
+    def test_thumbnail_lock_falls_back_to_original(self):
+        """
+        Пока миниатюры делает другой процесс, страница не ждет его
+        дольше THUMBNAIL_BUILD_WAIT и показывает оригинал
+        """
+
+        for variant in card_variants():
+            cache.set(lock_key(thumbnail_file(
+                self.post.image, variant.geometry, variant.options)), True)
+
+        response = self.authorized_author.get(reverse('posts:index'))
+
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        self.assertEqual(lock_waits(), len(card_variants()))
+
+    @override_settings(THUMBNAIL_BUILD_WAIT=0)
+    def test_card_switches_to_thumbnail(self):
+        """
+        Оригинал, показанный вместо миниатюры, не остается в кэше
+        страницы и карточки, когда миниатюры готовы
+        """
+
+        locks = [lock_key(thumbnail_file(
+            self.post.image, variant.geometry, variant.options))
+            for variant in card_variants()]
+        for key in locks:
+            cache.set(key, True)
+        Follow.objects.create(user=self.test_user_author,
+                              author=self.test_user_author)
+        for url in (reverse('posts:index'), reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                response = self.authorized_author.get(url)
+                self.assertContains(response,
+                                    f'src="{self.post.image.url}"')
+                self.assertNotContains(response, '<picture>')
+
+        cache.delete_many(locks)
+        generate_thumbnails(self.post.image.name)
+
+        for url in (reverse('posts:index'), reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                response = self.authorized_author.get(url)
+                self.assertContains(response, '<picture>')
+                self.assertNotContains(response,
+                                       f'src="{self.post.image.url}"')
+
     def test_index_context(self):
         """Проверка контекста на странице index"""
 
@@ -308,6 +421,47 @@ class PaginatorTest(TestCase):
         self.assertEqual(len(response_group_list.context['page_obj']), 3)
         self.assertEqual(len(response_profile.context['page_obj']), 3)
 
+    def test_cursor_pages(self):
+        """
+        Навигация по курсору: следующая страница первой страницы
+        содержит 3 записи, возврат ведет к свежим записям
+        """
+
+        url = reverse('posts:index')
+        first_page = self.authorized_author.get(url).context['page_obj']
+        response = self.authorized_author.get(
+            url + f'?after={first_page.next_cursor}')
+        page_obj = response.context['page_obj']
+
+        self.assertEqual(len(page_obj), 3)
+        self.assertFalse(page_obj.has_next())
+        self.assertEqual(page_obj[0].pk, first_page[9].pk - 1)
+
+        response = self.authorized_author.get(
+            url + f'?before={page_obj.previous_cursor}')
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in first_page])
+
+    def test_broken_cursor(self):
+        """Испорченный курсор отдает первую страницу"""
+
+        cursors = ('after=abc', 'after=99999999999999999999.1',
+                   'after=-99999999999999999.1',
+                   'before=1.99999999999999999999999', 'after=1.-5')
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                cache.clear()
+                response = self.authorized_author.get(
+                    reverse('posts:index') + f'?{cursor}')
+                self.assertEqual(len(response.context['page_obj']), 10)
+
+        post = Post.objects.first()
+        response = self.authorized_author.get(
+            reverse('posts:post_comments', kwargs={'post_id': post.pk})
+            + '?after=99999999999999999999.1')
+        self.assertEqual(response.status_code, 200)
+
 
 class AddPostTest(TestCase):
     """Тестирование появления нового поста на страницах приложения post"""
@@ -463,19 +617,13 @@ class CacheTest(TestCase):
 
         response = self.authorized_author.get(reverse('posts:index'))
         old_content = response.content
-        old_count_posts = Post.objects.count()
 
-        Post.objects.create(
-            text='Тестовый текст!',
-            group=self.group,
-            author=self.test_user_author,)
+        Post.objects.update(text='Изменено мимо сигналов!')
 
         response = self.authorized_author.get(reverse('posts:index'))
         new_content = response.content
-        new_count_posts = Post.objects.count()
 
         self.assertEqual(old_content, new_content)
-        self.assertNotEqual(new_count_posts, old_count_posts)
 
         cache.clear()
 
@@ -484,6 +632,215 @@ class CacheTest(TestCase):
 
         self.assertNotEqual(old_content, new_content_clear)
 
+    def test_index_cache_invalidation(self):
+        """
+        Создание, изменение и удаление записи
+        сразу сбрасывают кэш страницы index
+        """
+
+        response = self.authorized_author.get(reverse('posts:index'))
+        old_content = response.content
+
+        post = Post.objects.create(
+            text='Новый тестовый текст!',
+            group=self.group,
+            author=self.test_user_author,)
+        response = self.authorized_author.get(reverse('posts:index'))
+        self.assertNotEqual(old_content, response.content)
+        self.assertContains(response, post.text)
+
+        post.delete()
+        response = self.authorized_author.get(reverse('posts:index'))
+        self.assertNotContains(response, post.text)
+
+    def test_index_cached_per_user(self):
+        """Главная вошедшего пользователя не отдается другим"""
+
+        self.authorized_author.get(reverse('posts:index'))
+
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пользователь: Leo')
+        self.assertContains(response, 'Войти')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=20)
+    def test_index_cache_expires(self):
+        """Страница в кэше живет не дольше PAGE_CACHE_TIMEOUT"""
+
+        old_content = self.client.get(reverse('posts:index')).content
+        Post.objects.update(text='Изменено мимо сигналов!')
+
+        later = time.time() + settings.PAGE_CACHE_TIMEOUT + 1
+        with mock.patch('posts.cache.time.time', return_value=later):
+            response = self.client.get(reverse('posts:index'))
+
+        self.assertNotEqual(response.content, old_content)
+        self.assertContains(response, 'Изменено мимо сигналов!')
+
+
+class StampedeTest(TestCase):
+    """Тестирование защиты кэша от одновременной пересборки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.test_user_author = User.objects.create_user(username='Leo')
+        cls.post = Post.objects.create(
+            text='Тестовый текст!',
+            author=cls.test_user_author,)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+        path = md5(reverse('posts:index').encode()).hexdigest()
+        self.lock_key = f'index_page.{path}.lock'
+
+    def test_stale_page_while_rebuilding(self):
+        """
+        Пока другой запрос пересобирает страницу,
+        отдается устаревшая копия
+        """
+
+        old_content = self.guest_client.get(reverse('posts:index')).content
+        Post.objects.create(text='Новый тестовый текст!',
+                            author=self.test_user_author,)
+
+        cache.add(self.lock_key, True)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, old_content)
+
+        cache.delete(self.lock_key)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый тестовый текст!')
+
+    @override_settings(CACHE_BUILD_WAIT=0)
+    def test_no_stale_page(self):
+        """Без устаревшей копии страница собирается после ожидания"""
+
+        cache.add(self.lock_key, True)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+
+
+class FragmentCacheTest(TestCase):
+    """Тестирование кэша карточек записей."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Max')
+        cls.author = User.objects.create_user(username='Leo')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            text='Тестовый текст!',
+            author=cls.author,)
+
+    def setUp(self):
+        self.authorized_user = Client(self.user)
+        self.authorized_user.force_login(self.user)
+        cache.clear()
+
+    def test_card_cached_until_post_changes(self):
+        """
+        Карточка берется из кэша, пока запись не сохранят,
+        даже на странице, которая целиком не кэшируется
+        """
+
+        url = reverse('posts:follow_index')
+        self.authorized_user.get(url)
+
+        Post.objects.update(text='Изменено мимо сигналов!')
+        self.assertContains(self.authorized_user.get(url), 'Тестовый текст!')
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Изменено через save!'
+        post.save()
+        self.assertContains(self.authorized_user.get(url),
+                            'Изменено через save!')
+
+    def test_card_changes_with_author(self):
+        """Смена имени автора обновляет карточку"""
+
+        url = reverse('posts:follow_index')
+        self.authorized_user.get(url)
+
+        self.author.first_name = 'Лев'
+        self.author.last_name = 'Толстой'
+        self.author.save()
+        self.assertContains(self.authorized_user.get(url), 'Лев Толстой')
+
+
+class TaggedCacheTest(TestCase):
+    """Тестирование кэша страниц для анонимных пользователей."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.group = Group.objects.create(
+            title='Тестовое название группы!',
+            description='Тестовое описание группы!',
+            slug='test_slug')
+        cls.another_group = Group.objects.create(
+            title='Другое тестовое название группы!',
+            description='Другое тестовое описание группы!',
+            slug='another_slug')
+
+        cls.test_user_author = User.objects.create_user(username='Leo')
+
+        cls.post = Post.objects.create(
+            text='Тестовый текст!',
+            group=cls.group,
+            author=cls.test_user_author,)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_pages_cached_for_guest(self):
+        """Страницы группы, профиля и поста берутся из кэша"""
+
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.test_user_author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        old_contents = [self.guest_client.get(url).content for url in urls]
+
+        Post.objects.update(text='Изменено мимо сигналов!')
+
+        for url, old_content in zip(urls, old_contents):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.content, old_content)
+
+    def test_comment_invalidates_post_page(self):
+        """Новый комментарий сразу виден на странице поста"""
+
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        Comment.objects.create(text='Свежий комментарий!',
+                               author=self.test_user_author, post=self.post)
+
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий!')
+
+    def test_moved_post_invalidates_old_group(self):
+        """Перенос записи в другую группу обновляет обе страницы групп"""
+
+        old_url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        new_url = reverse('posts:group_list',
+                          kwargs={'slug': self.another_group.slug})
+        self.guest_client.get(old_url)
+        self.guest_client.get(new_url)
+
+        self.post.group = self.another_group
+        self.post.save()
+
+        self.assertNotContains(self.guest_client.get(old_url), self.post.text)
+        self.assertContains(self.guest_client.get(new_url), self.post.text)
+
 
 class FollowTest(TestCase):
     """Тестирование подписок на авторов"""
@@ -553,3 +910,446 @@ class FollowTest(TestCase):
 
         self.assertEqual(Follow.objects.count(), count_follows + 1)
         self.assertNotEqual(response_user, response_another_user)
+
+    def test_feed_unfollow_and_backfill(self):
+        """
+        Лента подписок очищается при отписке
+        и восстанавливается командой backfill_feed
+        """
+
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Новый пост!', author=self.author)
+        self.assertEqual(FeedItem.objects.filter(user=self.user).count(), 2)
+
+        self.authorized_user.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}))
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+
+        Follow.objects.bulk_create([Follow(user=self.user,
+                                           author=self.author)])
+        call_command('backfill_feed', stdout=StringIO())
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    @override_settings(FEED_PULL_THRESHOLD=2)
+    def test_hybrid_feed(self):
+        """
+        Записи популярного автора подмешиваются в ленту при чтении
+        и идут вперемешку с разложенными записями по дате
+        """
+
+        Follow.objects.create(user=self.another_user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.another_user)
+        for i in range(6):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+            Post.objects.create(text=f'Пост {i}', author=self.another_user)
+
+        self.assertFalse(FeedItem.objects.filter(
+            user=self.user, post__author=self.author).exists())
+
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        first_page = response.context['page_obj']
+        response = self.authorized_user.get(
+            reverse('posts:follow_index') + '?page=2')
+        second_page = response.context['page_obj']
+        posts = list(first_page) + list(second_page)
+        expected = list(Post.objects.filter(
+            author__in=(self.author, self.another_user)).order_by(
+                '-pub_date', '-id'))
+
+        self.assertEqual(first_page.paginator.count, 13)
+        self.assertEqual(posts, expected)
+
+        response = self.authorized_user.get(
+            reverse('posts:follow_index')
+            + f'?after={first_page.next_cursor}')
+        self.assertEqual(list(response.context['page_obj']),
+                         list(second_page))
+
+    @override_settings(FEED_PULL_THRESHOLD=2)
+    def test_hybrid_feed_shallow_pages(self):
+        """
+        Смешанная лента по номеру открывает только первые страницы
+        и не ссылается на последнюю
+        """
+
+        Follow.objects.create(user=self.another_user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(25):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+
+        with mock.patch.object(MergedFeed, 'max_pages', 1):
+            response = self.authorized_user.get(
+                reverse('posts:follow_index') + '?page=3')
+
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertNotContains(response, 'Последняя')
+        self.assertContains(response, f'?after={page_obj.next_cursor}')
+
+    @override_settings(FEED_PULL_THRESHOLD=2, FEED_PUSH_THRESHOLD=2)
+    def test_author_stops_being_popular(self):
+        """
+        Когда автор перестает быть популярным, rebalance_feeds
+        раскладывает его записи времен популярности по лентам всех
+        подписчиков; до этого они подмешиваются при чтении
+        """
+
+        Follow.objects.create(user=self.another_user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        popular_post = Post.objects.create(text='Пост популярного автора',
+                                           author=self.author)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT("posts_follow"' in query['sql']])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_another_user.get(reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author.username}))
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('INSERT')])
+
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [popular_post, self.post])
+
+        call_command('rebalance_feeds', stdout=StringIO())
+
+        self.assertFalse(UserStats.objects.get(user=self.author).pulled)
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user, post=popular_post).exists())
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [popular_post, self.post])
+
+    @override_settings(FEED_PULL_THRESHOLD=3)
+    def test_popularity_hysteresis(self):
+        """
+        Автор у порога остается популярным, пока подписчиков не станет
+        меньше FEED_PUSH_THRESHOLD; после reconcile_stats или смены
+        порога rebalance_feeds переключает его в любую сторону
+        """
+
+        third_user = User.objects.create_user(username='Third')
+        for user in (self.user, self.another_user, third_user):
+            Follow.objects.create(user=user, author=self.author)
+        self.assertTrue(UserStats.objects.get(user=self.author).pulled)
+
+        Follow.objects.get(user=third_user).delete()
+        call_command('rebalance_feeds', stdout=StringIO())
+        self.assertTrue(UserStats.objects.get(user=self.author).pulled)
+
+        with override_settings(FEED_PULL_THRESHOLD=10):
+            call_command('rebalance_feeds', stdout=StringIO())
+        self.assertFalse(UserStats.objects.get(user=self.author).pulled)
+
+        with override_settings(FEED_PULL_THRESHOLD=2):
+            call_command('rebalance_feeds', stdout=StringIO())
+        self.assertTrue(UserStats.objects.get(user=self.author).pulled)
+
+
+class UserStatsTest(TestCase):
+    """Тестирование счетчиков пользователя."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Max')
+        cls.author = User.objects.create_user(username='Leo')
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self, user):
+        return UserStats.objects.values_list(
+            'posts', 'comments', 'followers', 'following').get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются вместе с записями, комментариями и подписками"""
+
+        post = Post.objects.create(text='Тестовый текст!', author=self.author)
+        comment = Comment.objects.create(text='Комментарий', post=post,
+                                         author=self.user)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+
+        self.assertEqual(self.stats(self.author), (1, 0, 1, 0))
+        self.assertEqual(self.stats(self.user), (0, 1, 0, 1))
+
+        comment.delete()
+        follow.delete()
+        post.delete()
+
+        self.assertEqual(self.stats(self.author), (0, 0, 0, 0))
+        self.assertEqual(self.stats(self.user), (0, 0, 0, 0))
+
+    def test_counters_roll_back_with_follow(self):
+        """Сбой после сохранения подписки откатывает и ее, и счетчики"""
+
+        Follow.objects.create(user=self.author, author=self.user)
+        before = self.stats(self.author), self.stats(self.user)
+        client = Client()
+        client.force_login(self.user)
+
+        with mock.patch('posts.feed.add_author',
+                        side_effect=DatabaseError('сбой')):
+            with self.assertRaises(DatabaseError):
+                client.get(reverse('posts:profile_follow',
+                                   kwargs={'username': self.author}))
+
+        self.assertFalse(Follow.objects.filter(user=self.user).exists())
+        self.assertEqual((self.stats(self.author), self.stats(self.user)),
+                         before)
+
+    def test_profile_without_count_queries(self):
+        """Профиль берет число записей из счетчика, а не из COUNT(*)"""
+
+        for i in range(3):
+            Post.objects.create(text=f'Запись {i}', author=self.author)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(
+                'posts:profile', kwargs={'username': self.author.username}))
+
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        self.assertContains(response, 'Всего постов: 3')
+        counts = [query['sql'] for query in queries.captured_queries
+                  if 'COUNT(' in query['sql']]
+        self.assertEqual(counts, [])
+
+    def test_reconcile_stats(self):
+        """reconcile_stats исправляет разошедшиеся и недостающие счетчики"""
+
+        Post.objects.create(text='Тестовый текст!', author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts=10)
+        UserStats.objects.filter(user=self.user).delete()
+
+        out = StringIO()
+        call_command('reconcile_stats', batch_size=1, stdout=out)
+
+        self.assertEqual(self.stats(self.author), (1, 0, 0, 0))
+        self.assertEqual(self.stats(self.user), (0, 0, 0, 0))
+        self.assertIn('исправлено: 2', out.getvalue())
+
+
+class CommentPagesTest(TestCase):
+    """Тестирование постраничного вывода комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(username='Leo')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы!',
+            description='Тестовое описание группы!',
+            slug='test_slug')
+        cls.post = Post.objects.create(text='Тестовый текст!',
+                                       author=cls.author, group=cls.group)
+        cls.commentators = [User.objects.create_user(username=f'user{i}')
+                            for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def add_comments(self, count):
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', post=self.post,
+                    author=self.commentators[i % 3])
+            for i in range(count))
+
+    def detail_queries(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_constant_queries(self):
+        """Число запросов не зависит от числа комментариев"""
+
+        self.add_comments(3)
+        few = self.detail_queries()
+        self.add_comments(100)
+
+        self.assertEqual(self.detail_queries(), few)
+
+    def test_load_more(self):
+        """Фрагмент «Показать еще» продолжает список с курсора"""
+
+        self.add_comments(COMMENTS_PAGE + 5)
+        expected = list(Comment.objects.order_by(
+            '-created', '-id').values_list('text', flat=True))
+
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        first = response.context['comments']
+        self.assertEqual([comment.text for comment in first],
+                         expected[:COMMENTS_PAGE])
+        fragment_url = reverse('posts:post_comments',
+                               kwargs={'post_id': self.post.pk})
+        self.assertContains(response,
+                            f'{fragment_url}?after={first.next_cursor}')
+
+        response = self.client.get(fragment_url,
+                                   {'after': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual([comment.text for comment in
+                          response.context['comments']],
+                         expected[COMMENTS_PAGE:])
+        self.assertFalse(response.context['comments'].has_next())
+
+
+class CommentCountTest(TestCase):
+    """Тестирование счетчика комментариев в лентах."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(username='Leo')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы!',
+            description='Тестовое описание группы!',
+            slug='test_slug')
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.author}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Запись {i}', author=self.author,
+                                       group=self.group)
+            for j in range(2):
+                Comment.objects.create(text=f'Комментарий {j}', post=post,
+                                       author=self.author)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Комментариев: 2')
+        return len(queries)
+
+    def test_counter_follows_comments(self):
+        """Счетчик растет при комментировании и уменьшается при удалении"""
+
+        post = Post.objects.create(text='Тестовый текст!', author=self.author)
+        self.client.force_login(self.author)
+        self.client.post(reverse('posts:add_comment',
+                                 kwargs={'post_id': post.pk}),
+                         {'text': 'Комментарий'})
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+        post.comments.get().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_feeds_fixed_queries(self):
+        """Число запросов лент не зависит от числа записей на странице"""
+
+        self.add_posts(1)
+        few = {url: self.count_queries(url) for url in self.urls}
+        self.add_posts(9)
+
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_index_page_refreshes_on_comment(self):
+        """Новый комментарий обновляет счетчик на закэшированной главной"""
+
+        self.add_posts(1)
+        self.client.get(reverse('posts:index'))
+        Comment.objects.create(text='Еще один', post=Post.objects.get(),
+                               author=self.author)
+
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            'Комментариев: 3')
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Бюджет SQL-запросов для каждого адреса приложения."""
+
+    # Имя маршрута -> (метод, бюджет запросов). Записей больше, чем
+    # помещается на страницу: число запросов не должно от них зависеть.
+    BUDGETS = {
+        'index': ('get', 4),
+        'group_list': ('get', 5),
+        'profile': ('get', 6),
+        'post_detail': ('get', 4),
+        'post_create': ('post', 11),
+        'post_edit': ('post', 8),
+        'post_comments': ('get', 4),
+        'add_comment': ('post', 10),
+        'follow_index': ('get', 5),
+        'profile_follow': ('get', 4),
+        'profile_unfollow': ('get', 13),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='Max')
+        cls.author = User.objects.create_user(username='Leo')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы!',
+            description='Тестовое описание группы!',
+            slug='test_slug')
+        for i in range(1, 14):
+            post = Post.objects.create(text=f'Запись {i}', author=cls.author,
+                                       group=cls.group)
+            Comment.objects.create(text='Комментарий', post=post,
+                                   author=cls.user)
+        cls.post = post
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def url_args(self, name):
+        if name == 'group_list':
+            return {'slug': self.group.slug}
+        if name.startswith('profile'):
+            return {'username': self.author.username}
+        if name in ('index', 'post_create', 'follow_index'):
+            return {}
+        return {'post_id': self.post.pk}
+
+    def test_every_url_has_budget(self):
+        """Для каждого маршрута posts/urls.py задан бюджет"""
+
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(self.BUDGETS))
+
+    def test_query_budgets(self):
+        """Адреса приложения укладываются в свой бюджет запросов"""
+
+        data = {
+            'post_create': {'text': 'Новая запись', 'group': ''},
+            'post_edit': {'text': 'Исправленная запись', 'group': ''},
+            'add_comment': {'text': 'Новый комментарий'},
+        }
+        for name, (method, budget) in self.BUDGETS.items():
+            client = self.client
+            if name in ('follow_index', 'profile_follow', 'profile_unfollow'):
+                client = Client()
+                client.force_login(self.user)
+            with self.subTest(name=name):
+                cache.clear()
+                url = reverse(f'posts:{name}', kwargs=self.url_args(name))
+                self.assertQueryBudget(budget, url, method, client,
+                                       data=data.get(name, {}))
@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+from core.timing import timed
+
+from .cache import skip_page_cache
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+# Размер миниатюры карточки и ширины ее вариантов для srcset.
+CARD_SIZE = (960, 339)
+CARD_WIDTHS = (320, 640, 960)
+
+Variant = namedtuple('Variant', 'format width geometry options')
+# Оригинал вместо миниатюры, которую еще делает другой процесс.
+Original = namedtuple('Original', 'url width height')
+
+# Сколько секунд живет блокировка генерации одной миниатюры.
+LOCK_TIMEOUT = 30
+BUSY = object()
+WAITS_KEY = 'thumbnails.lock_waits'
+
+# Картинки, чьи миниатюры создаются по окончании текущего запроса:
+# их забирает обработчик request_finished в том же потоке. Отдельный
+# поток-исполнитель мог пережить запрос и столкнуться с очисткой
+# медиафайлов, а здесь генерация идет до следующего запроса потока.
+pending = threading.local()
+
+
+def card_formats():
+    """Форматы миниатюр: WebP, если Pillow собран с ним, и JPEG."""
+    if features.check('webp'):
+        return ('WEBP', 'JPEG')
+    return ('JPEG',)
+
+
+def card_variants():
+    """Все миниатюры карточки: каждый формат в каждой ширине."""
+    width, height = CARD_SIZE
+    return [
+        Variant(image_format, variant_width,
+                f'{variant_width}x{round(variant_width * height / width)}',
+                {'crop': 'center', 'upscale': True, 'format': image_format})
+        for image_format in card_formats()
+        for variant_width in CARD_WIDTHS
+    ]
+
+
+def generate_thumbnails(image):
+    """
+    Создать все варианты миниатюр картинки записи (имени файла или
+    Post.image). Варианты, которые уже делает другой процесс,
+    пропускаются.
+    """
+    # Ключи sorl зависят от хранилища исходника: берем то же, что у поля.
+    image = ImageFile(image, image_storage)
+    for variant in card_variants():
+        thumbnail = thumbnail_file(image, variant.geometry, variant.options)
+        build_thumbnail(image, variant, thumbnail)
+
+
+def schedule_thumbnails(post):
+    """
+    Создать миниатюры после коммита, когда ответ уже отдан клиенту,
+    чтобы ни автор, ни первый посетитель ленты не ждали Pillow.
+    """
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: _pending_names().append(name))
+
+
+def _pending_names():
+    if not hasattr(pending, 'names'):
+        pending.names = []
+    return pending.names
+
+
+def generate_pending():
+    """Создать миниатюры, отложенные schedule_thumbnails в этом потоке."""
+    names, pending.names = _pending_names(), []
+    for name in names:
+        try:
+            generate_thumbnails(name)
+        except Exception:
+            logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+def thumbnail_file(image, geometry, options):
+    """
+    Файл миниатюры, которую создал бы get_thumbnail, без обращения
+    к хранилищу: опции дополняются так же, как в ThumbnailBackend.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def _thumbnail_or_none(image, geometry, options):
+    # Для отсутствующего файла sorl возвращает миниатюру без размеров.
+    try:
+        thumbnail = get_thumbnail(image, geometry, **options)
+    except Exception:
+        logger.exception('Миниатюра для %s не создана', image)
+        return None
+    return thumbnail if thumbnail.size else None
+
+
+def lock_key(thumbnail):
+    return f'{add_prefix(thumbnail.key)}.lock'
+
+
+def build_wait():
+    """Сколько секунд ждать миниатюру, которую делает другой процесс."""
+    return getattr(settings, 'THUMBNAIL_BUILD_WAIT', 1)
+
+
+def lock_waits():
+    """Сколько раз запросы ждали чужую генерацию миниатюры."""
+    return cache.get(WAITS_KEY, 0)
+
+
+def _count_wait():
+    if not cache.add(WAITS_KEY, 1, None):
+        try:
+            cache.incr(WAITS_KEY)
+        except ValueError:
+            pass
+
+
+def build_thumbnail(image, variant, thumbnail, deadline=None):
+    """
+    Создать миниатюру под блокировкой в общем кэше: одну миниатюру
+    в каждый момент делает только один процесс. Остальные ждут ее
+    в key-value хранилище до deadline (time.monotonic), без deadline
+    не ждут. Возвращает миниатюру, None, если ее не удалось создать,
+    и BUSY, если не дождались.
+    """
+    key = lock_key(thumbnail)
+    if cache.add(key, True, LOCK_TIMEOUT):
+        try:
+            built = _thumbnail_or_none(image, variant.geometry,
+                                       variant.options)
+        finally:
+            cache.delete(key)
+        if built is not None:
+            metrics.inc('yatube_thumbnails_generated_total')
+        return built
+    if deadline is None:
+        return BUSY
+    _count_wait()
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        built = default.kvstore.get(thumbnail)
+        if built is not None:
+            return built
+    return BUSY
+
+
+def _stored_thumbnails(keys):
+    """
+    Сериализованные миниатюры по ключам key-value хранилища:
+    сначала один get_many из кэша, промахи - одним запросом к БД.
+    """
+    kv_cache = default.kvstore.cache
+    found = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        if stored:
+            kv_cache.set_many(
+                stored, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(stored)
+    return {key: value for key, value in found.items()
+            if isinstance(value, str)}
+
+
+def _wanted_thumbnails(posts):
+    """Ключ key-value хранилища -> (запись, вариант, файл миниатюры)."""
+    wanted = {}
+    for post in posts:
+        post.thumbnail, post.srcsets = None, {}
+        if post.image:
+            for variant in card_variants():
+                thumbnail = thumbnail_file(post.image, variant.geometry,
+                                           variant.options)
+                wanted[add_prefix(thumbnail.key)] = (post, variant,
+                                                     thumbnail)
+    return wanted
+
+
+@timed('thumbnail')
+def resolve_thumbnails(posts):
+    """
+    Миниатюры карточек для страницы ленты одним обращением к key-value
+    хранилищу sorl-thumbnail вместо запроса на каждую карточку.
+    В post.srcsets кладутся варианты по форматам: {формат: [(ширина,
+    миниатюра)]}, в post.thumbnail - JPEG полной ширины. Чего нет
+    в хранилище, создается под блокировкой build_thumbnail. Чужую
+    генерацию страница ждет не дольше THUMBNAIL_BUILD_WAIT секунд
+    в сумме, а потом показывает оригинал картинки.
+    """
+    wanted = _wanted_thumbnails(posts)
+    found = {}
+    if wanted and isinstance(default.kvstore, cached_db_kvstore.KVStore):
+        found = _stored_thumbnails(list(wanted))
+    deadline = time.monotonic() + build_wait()
+    busy = set()
+    for key, (post, variant, thumbnail) in wanted.items():
+        if key in found:
+            thumbnail = deserialize_image_file(found[key])
+        else:
+            thumbnail = build_thumbnail(post.image, variant, thumbnail,
+                                        deadline)
+        if thumbnail is BUSY:
+            busy.add(post)
+        elif thumbnail is not None:
+            post.srcsets.setdefault(variant.format, []).append(
+                (variant.width, thumbnail))
+            if variant.format == 'JPEG' and variant.width == CARD_SIZE[0]:
+                post.thumbnail = thumbnail
+    for post in busy:
+        post.thumbnail, post.srcsets = original(post), {}
+        # Карточка с оригиналом кэшируется под своим ключом, а страница
+        # не кэшируется вовсе: когда миниатюры будут готовы, следующий
+        # запрос покажет их.
+        post.card_version = f'{getattr(post, "card_version", "")}.orig'
+    if busy:
+        skip_page_cache()
+
+
+def original(post):
+    """Оригинал картинки с размерами, записанными при загрузке."""
+    width, height = post.image_width, post.image_height
+    if not width or not height:
+        width, height = CARD_SIZE
+    return Original(post.image.url, width, height)
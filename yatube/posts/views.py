@@ -1,32 +1,73 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.cache import cache_page
 
+from .cache import cache_page, post_tags, set_card_versions, tag
+from .feed import FEED_KEYS, timeline
 from .forms import PostForm, CommentForm
 from .models import Group, Post, User, Follow
+from .pagination import (CursorPaginator, ShallowPaginator, decode_cursor,
+                         encode_cursor)
+from .stats import stats_for
+from .thumbnails import resolve_thumbnails, schedule_thumbnails
 
 PAGE: int = 10
-
-
-def paginator(request, post_list):
-    """Paginator для шаблонов"""
-    paginator = Paginator(post_list, PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+COMMENTS_PAGE: int = 20
+COMMENT_KEYS = ('created', 'id')
+
+
+def paginator(request, post_list, keys=('pub_date', 'id'), count=None):
+    """
+    Paginator для шаблонов.
+    ?page=N - обычная постраничная навигация,
+    ?after=/?before= - навигация по курсору (старее/новее).
+    keys - поля даты и id, по которым сортируется лента;
+    count - уже известное число записей, чтобы не считать их COUNT(*).
+    Если у ленты задан max_pages, по номеру открываются только первые
+    max_pages страниц.
+    """
+    post_list = post_list.order_by(f'-{keys[0]}', f'-{keys[1]}')
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before'))
+    if after or before:
+        cursor_paginator = CursorPaginator(post_list, PAGE, keys)
+        if after:
+            page_obj = cursor_paginator.page_after(after)
+        else:
+            page_obj = cursor_paginator.page_before(before)
+    else:
+        max_pages = getattr(post_list, 'max_pages', None)
+        if max_pages is None:
+            paginator = Paginator(post_list, PAGE)
+        else:
+            paginator = ShallowPaginator(post_list, PAGE, max_pages)
+        if count is not None:
+            paginator.count = count
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        if page_obj.has_next():
+            page_obj.next_cursor = encode_cursor(page_obj[-1], keys)
+    page_obj.object_list = list(page_obj.object_list)
+    set_card_versions(page_obj.object_list)
+    resolve_thumbnails(page_obj.object_list)
     return page_obj
 
 
-@cache_page(timeout=20, key_prefix='index_page')
+@cache_page(key_prefix='index_page', tags=['index_page'])
 def index(request):
     """Главная страница со всеми записями"""
     post_list = Post.objects.select_related('author', 'group').order_by(
         '-pub_date')
     context = {'page_obj': paginator(request, post_list), }
-    return render(request, 'posts/index.html', context)
+    response = render(request, 'posts/index.html', context)
+    # Комментарий меняет счетчик на карточке: страница тоже устаревает.
+    response.cache_tags = post_tags(context['page_obj'])
+    return response
 
 
+@cache_page(key_prefix='tagged_page', anonymous_only=True)
 def group_posts(request, slug):
     """Страница с записями одной группы"""
     group = get_object_or_404(Group, slug=slug)
@@ -37,32 +78,74 @@ def group_posts(request, slug):
         'page_obj': paginator(request, post_list),
     }
     template = 'posts/group_list.html'
-    return render(request, template, context)
+    response = render(request, template, context)
+    response.cache_tags = {tag('group', group.pk)} | post_tags(
+        context['page_obj'])
+    return response
 
 
+@cache_page(key_prefix='tagged_page', anonymous_only=True)
 def profile(request, username):
     """Страница с записями одного автора"""
     user = get_object_or_404(User, username=username)
     following = (request.user.is_authenticated and Follow.objects.filter(
         author=user, user=request.user).exists())
+    user_stats = stats_for(user)
     post_list = user.posts.select_related('author', 'group').order_by(
         '-pub_date')
-    context = {'author': user, 'page_obj': paginator(request, post_list),
+    context = {'author': user, 'stats': user_stats,
+               'page_obj': paginator(request, post_list,
+                                     count=user_stats.posts),
                'following': following, }
-    return render(request, 'posts/profile.html', context)
+    response = render(request, 'posts/profile.html', context)
+    response.cache_tags = {tag('author', user.pk)} | post_tags(
+        context['page_obj'])
+    return response
+
+
+def comment_page(request, post):
+    """
+    Страница комментариев записи, от новых к старым, одним запросом.
+    ?after= - курсор последнего показанного комментария.
+    """
+    comments = CursorPaginator(post.comments.select_related('author'),
+                               COMMENTS_PAGE, COMMENT_KEYS)
+    after = decode_cursor(request.GET.get('after'))
+    page_obj = comments.page_after(after) if after else comments.first_page()
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
+
 
+def comment_tags(post, comments):
+    return {tag('post', post.pk)} | {
+        tag('author', comment.author_id) for comment in comments}
 
+
+@cache_page(key_prefix='tagged_page', anonymous_only=True)
 def post_detail(request, post_id):
     """Страница с одной записью"""
-    post = get_object_or_404(Post, id=post_id)
-    count_posts = post.author.posts.count
-    comments = post.comments.select_related('author', 'post').order_by(
-        '-created')
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    count_posts = stats_for(post.author).posts
+    comments = comment_page(request, post)
     form = PostForm()
     comment_form = CommentForm()
     context = {'post': post, 'count_posts': count_posts, 'comments': comments,
                'form': form, 'comment_form': comment_form}
-    return render(request, 'posts/post_detail.html', context)
+    response = render(request, 'posts/post_detail.html', context)
+    response.cache_tags = post_tags([post]) | comment_tags(post, comments)
+    return response
+
+
+@cache_page(key_prefix='tagged_page', anonymous_only=True)
+def post_comments(request, post_id):
+    """Фрагмент со следующей страницей комментариев для «Показать еще»"""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    comments = comment_page(request, post)
+    response = render(request, 'posts/includes/comments.html',
+                      {'post': post, 'comments': comments})
+    response.cache_tags = comment_tags(post, comments)
+    return response
 
 
 @csrf_exempt
@@ -74,7 +157,11 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        # Запись и счетчики, которые меняют ее сигналы, сохраняются
+        # одной транзакцией: сбой посередине не оставит их разошедшимися.
+        with transaction.atomic():
+            post.save()
+            schedule_thumbnails(post)
         return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -90,7 +177,10 @@ def post_edit(request, post_id):
                         files=request.FILES or None,
                         instance=post_to_edit)
         if form.is_valid():
-            form = form.save()
+            with transaction.atomic():
+                post = form.save()
+                if 'image' in form.changed_data:
+                    schedule_thumbnails(post)
             return redirect('posts:post_detail', post_id)
         return render(request, 'posts/create_post.html',
                       {'is_edit': is_edit, 'form': form})
@@ -106,7 +196,8 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -115,11 +206,9 @@ def add_comment(request, post_id):
 def follow_index(request):
     """Список записей от авторов по подписке"""
     user = request.user
-    authors_list = Follow.objects.filter(user=user).values_list('author_id',
-                                                                flat=True)
-    post_list = Post.objects.select_related(
-        'author', 'group').filter(author__in=authors_list)
-    context = {'page_obj': paginator(request, post_list), 'user': user}
+    post_list = timeline(user).select_related('author', 'group')
+    context = {'page_obj': paginator(request, post_list, FEED_KEYS),
+               'user': user}
     return render(request, 'posts/follow.html', context)
 
 
@@ -130,9 +219,10 @@ def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author and not Follow.objects.filter(
             user=request.user, author=author).exists():
-        Follow.objects.create(
-            user=request.user,
-            author=author)
+        with transaction.atomic():
+            Follow.objects.create(
+                user=request.user,
+                author=author)
         return redirect('posts:follow_index', )
     return redirect('posts:profile', username=author.username)
 
@@ -142,6 +232,8 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     """Отписаться от автора"""
     author = get_object_or_404(User, username=username)
+    # QuerySet.delete() сам удаляет строки и шлет post_delete
+    # в одной транзакции.
     Follow.objects.filter(
         user=request.user,
         author=author).delete()
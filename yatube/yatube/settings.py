@@ -8,10 +8,42 @@ DEBUG = True
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.LocMemCache',
     }
 }
 
+# Сколько секунд живут страницы и версии тегов в кэше. Кэш в памяти
+# у каждого worker-процесса свой и не видит смены версий в других,
+# поэтому срок короткий: новая запись видна всем не позже чем через
+# столько секунд. У общего кэша - пока не сменятся версии.
+PAGE_CACHE_TIMEOUT = 20
+
+# SHARED_CACHE=1 - один кэш на все worker-процессы хоста (страницы,
+# версии тегов, key-value хранилище sorl-thumbnail) в файле SQLite.
+if os.getenv('SHARED_CACHE'):
+    CACHES['default'] = {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
+    }
+    PAGE_CACHE_TIMEOUT = None
+
+# Авторы с таким числом подписчиков не раскладываются по лентам подписок,
+# их записи подмешиваются в ленту при чтении. Обратно к раскладке автор
+# возвращается, когда подписчиков меньше FEED_PUSH_THRESHOLD (по умолчанию
+# 0.9 от FEED_PULL_THRESHOLD): это делает manage.py rebalance_feeds
+# (по cron), а не запрос отписки.
+FEED_PULL_THRESHOLD = 10000
+
+# Сколько секунд отдается устаревшая страница, пока другой запрос
+# пересобирает ее, и сколько ждать сборщика, если копии в кэше нет.
+CACHE_STALE_GRACE = 10
+CACHE_BUILD_WAIT = 2
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 ALLOWED_HOSTS = [
@@ -24,6 +56,106 @@ ALLOWED_HOSTS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Медиафайлы отдает core.media.serve и при DEBUG=False. Браузер не
+# перепроверяет их MEDIA_MAX_AGE секунд, файлы с хэшем в имени - никогда.
+# MEDIA_SENDFILE = 'x-sendfile' или 'x-accel-redirect' передает отдачу
+# веб-серверу; для nginx нужна internal-локация MEDIA_ACCEL_PREFIX.
+MEDIA_MAX_AGE = 24 * 60 * 60
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Загрузки пишутся сразу во временный файл, а не копятся в памяти.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Оригиналы картинок больше этой стороны уменьшаются при загрузке,
+# картинки больше IMAGE_MAX_PIXELS пикселей не принимаются.
+IMAGE_MAX_SIDE = 2560
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+# Сколько секунд страница ждет миниатюры, которые делает другой процесс,
+# прежде чем показать оригинал картинки.
+THUMBNAIL_BUILD_WAIT = 1
+
+# Сколько SQL-запросов может сделать одно представление: при превышении
+# core.queries.QueryBudgetMiddleware пишет предупреждение в лог.
+# QUERY_BUDGETS задает бюджет по имени маршрута, QUERY_BUDGET - остальным.
+# Первый показ новой картинки строит миниатюры: около 30 запросов на нее.
+QUERY_BUDGET = 50
+QUERY_BUDGETS = {}
+
+# SQL-запросы дольше SLOW_QUERY_MS миллисекунд (None - не следить)
+# пишутся с маршрутом, стеком и EXPLAIN QUERY PLAN в SLOW_QUERY_LOG,
+# файл ротируется по SLOW_QUERY_LOG_MAX_BYTES. Сводка - manage.py
+# slow_queries.
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = os.getenv(
+    'SLOW_QUERY_LOG', os.path.join(BASE_DIR, 'slow_queries.log'))
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'format': '%(asctime)s %(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': SLOW_QUERY_LOG_MAX_BYTES,
+            'backupCount': 5,
+            'delay': True,
+            'encoding': 'utf-8',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Разбивка ответа по фазам (core.timing) уходит в заголовке Server-Timing
+# при DEBUG и персоналу, а при SERVER_TIMING_PUBLIC - всем. TIMING_LOG=путь
+# - писать те же замеры каждого запроса строками JSON в файл; сводку
+# по нему печатает manage.py timing_report.
+SERVER_TIMING_PUBLIC = False
+TIMING_LOG = os.getenv('TIMING_LOG')
+if TIMING_LOG:
+    LOGGING['handlers']['timing'] = {
+        'class': 'logging.FileHandler',
+        'filename': TIMING_LOG,
+        'formatter': 'json',
+    }
+    LOGGING['loggers']['core.timing'] = {
+        'handlers': ['timing'],
+        'level': 'INFO',
+        'propagate': False,
+    }
+
+# cProfile для доли запросов PROFILE_SAMPLE_RATE (0 - выключено) и для
+# запросов с заголовком X-Profile из manage.py profile_token. Профили
+# лежат в PROFILE_DIR по каталогу на маршрут, в каждом не больше
+# PROFILE_KEEP файлов; сводка для персонала - /admin/profiles/.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_KEEP = 50
+PROFILE_TOKEN_MAX_AGE = 24 * 60 * 60
+
+# Метрики запросов, кэша страниц и миниатюр всех worker-процессов хоста
+# копятся в одном файле SQLite (по умолчанию во временном каталоге)
+# и отдаются на /metrics. METRICS_TOKEN закрывает /metrics заголовком
+# Authorization: Bearer <токен>.
+if os.getenv('METRICS_PATH'):
+    METRICS_PATH = os.getenv('METRICS_PATH')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# manage.py test пишет метрики во временный файл, а не в METRICS_PATH.
+TEST_RUNNER = 'core.testing.TestRunner'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -48,6 +180,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.queries.QueryBudgetMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.timing.ServerTimingMiddleware',
+    'core.slow_queries.SlowQueryMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +199,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {